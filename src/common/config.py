@@ -75,8 +75,30 @@ class ConfigLoader(object):
         default_configuration = {
             'Explorer': {'folder':          '',
                          # Set folder to your music directory.
-                         'scan_at_startup': int(False)
+                         'scan_at_startup': int(False),
                          # True if you want to check for new songs at launch.
+                         'incremental_scan': int(True),
+                         # True to only read again the modified files, False
+                         # to read the whole music directory at each scan.
+                         'scan_workers':    4,
+                         # Number of workers reading tags during a scan.
+                         'scan_pool':       'thread'
+                         # Available pools are: thread and process.
+                        },
+            'Lastfm':   {'workers':         2,
+                         # Number of pictures downloaded at the same time.
+                         'rate':            1.0
+                         # Maximum number of requests sent per second.
+                        },
+            'Webservices': {'timeout':      15
+                            # Seconds to wait for an answer of a web service.
+                           },
+            'Player':   {'prefetch_depth':  3,
+                         # Number of upcoming songs prepared in advance.
+                         'prefetch_workers': 2,
+                         # Number of songs prepared at the same time.
+                         'position_rate':   2
+                         # Number of position updates per second.
                         },
             'Playlist': {'repeat':          int(True),
                          # True to enable repeat mode.
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from urllib.error import URLError
+from threading import Thread, Lock
+from queue import Queue
+from time import time, monotonic, sleep
+
+from common.config import ConfigLoader
+from common.functions import Functions
+from common.sqlite import SQLite
+from common.webservices import LastFm
+
+class TokenBucket(object):
+    """Allow `rate` operations per second, `burst` of them at once. A rate
+    of 0 doesn't limit anything."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def take(self):
+        """Wait for a token and consume it."""
+        if self.rate <= 0:
+            return
+
+        while True:
+            self.lock.acquire()
+            try:
+                now = monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+            finally:
+                self.lock.release()
+
+            sleep(wait)
+
+class FetchScheduler(object):
+    """Download the missing album covers and artist pictures from Last.fm.
+
+    Requests are made by a few workers and limited to a number per second.
+    A picture already waiting or being downloaded is not asked twice, and the
+    queue is stored in the `fetch_queue` table so the downloads go on at the
+    next launch."""
+
+    ref = None
+    ref2 = None
+
+    def __new__(cls, *args, **kws):
+        # Singleton
+        if cls.ref is None:
+            cls.ref = object.__new__(cls)
+        return cls.ref
+
+    def __init__(self, lastfm=None):
+        if FetchScheduler.ref2 is None:
+            FetchScheduler.ref2 = 42
+
+            self.userconf = ConfigLoader()
+            self.functions = Functions()
+            if lastfm is None:
+                lastfm = LastFm()
+            self.lastfm = lastfm
+
+            workers = int(self.userconf.config['Lastfm']['workers'])
+            rate = float(self.userconf.config['Lastfm']['rate'])
+            self.bucket = TokenBucket(rate)
+
+            self.lock = Lock()
+            self.pending = set()
+            self.queue = Queue()
+
+            # Resume the downloads of the previous session
+            cur = SQLite().execute('select kind, artist, album from '
+                                   'fetch_queue order by added')
+            self.enqueue([tuple(item) for item in cur.fetchall()])
+
+            for i in range(max(1, workers)):
+                thread = Thread(group=None, target=self.worker,
+                                name='fetcher', args=())
+                thread.daemon = True
+                thread.start()
+
+    def fetch_albums(self, albums):
+        """Download the covers of a list of (artist, album), except the ones
+        Last.fm didn't have recently."""
+        misses = self.lastfm.album_misses.missing()
+        self.schedule([('album', artist, album) for (artist, album) in albums
+                       if self.functions.get_hash(album, artist) not in misses])
+
+    def fetch_artists(self, artists):
+        """Download the pictures of a list of artists, except the ones
+        Last.fm didn't have recently."""
+        misses = self.lastfm.artist_misses.missing()
+        self.schedule([('artist', artist, '') for artist in artists
+                       if self.functions.get_hash(artist, 'picture')
+                       not in misses])
+
+    def schedule(self, items):
+        items = self.enqueue(items)
+        if len(items) == 0:
+            return
+
+        sql = SQLite()
+        with sql.transaction():
+            sql.executemany('insert or ignore into fetch_queue (kind, artist, '
+                            'album, added) values (?, ?, ?, ?)',
+                            [item + (int(time()),) for item in items])
+
+        print('[FETCH] %d pictures queued.' % len(items))
+
+    def enqueue(self, items):
+        """Queue the items not already pending, return them."""
+        new_items = []
+
+        self.lock.acquire()
+        try:
+            for item in items:
+                if item not in self.pending:
+                    self.pending.add(item)
+                    new_items.append(item)
+        finally:
+            self.lock.release()
+
+        for item in new_items:
+            self.queue.put(item)
+
+        return new_items
+
+    def worker(self):
+        """Download the queued pictures."""
+        while True:
+            item = self.queue.get()
+            kind, artist, album = item
+            done = True
+
+            self.bucket.take()
+            try:
+                if kind == 'album':
+                    self.lastfm.get_album_picture(artist, album)
+                else:
+                    self.lastfm.get_artist_picture(artist)
+            except (URLError, OSError):
+                # Keep it for later, the network is probably down
+                print('[FETCH] Unable to reach Last.fm for ' + artist)
+                done = False
+            except Exception as error:
+                print('[FETCH] Unable to download a picture for %s: %s' %
+                      (artist, error))
+
+            if done:
+                SQLite().execute('delete from fetch_queue where kind=? and '
+                                 'artist=? and album=?', item)
+
+            self.lock.acquire()
+            self.pending.discard(item)
+            self.lock.release()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Versioned schema of the songs database.
+
+Every migration upgrades the database from the version before it. The
+version of a database is stored in its `user_version` and the migrations
+it lacks are applied, in order, each in its own transaction."""
+
+from sqlite3 import OperationalError
+
+def initial_schema(sql):
+    """Tables of Bluemindo 1.0, with the file state used by the scanner."""
+    sql.execute('create table if not exists songs ( '
+                'title text, '
+                'artist text, '
+                'album text, '
+                'comment text, '
+                'genre text, '
+                'year text, '
+                'track integer, '
+                'length integer, '
+                'filename text '
+                ')')
+
+    sql.execute('create table if not exists stats_songs ( '
+                'filename text, tracks integer )')
+
+    sql.execute('create table if not exists stats_albums ( '
+                'album text, tracks integer )')
+
+    sql.execute('create table if not exists stats_artists ( '
+                'artist text, tracks integer )')
+
+    cur = sql.execute('pragma table_info(songs)')
+    columns = [col[1] for col in cur.fetchall()]
+    for column in ('mtime', 'size', 'inode'):
+        if column not in columns:
+            sql.execute('alter table songs add column %s integer' % column)
+
+def keyed_schema(sql):
+    """Integer identifiers, indexes and keys for the statistics."""
+    sql.execute('create table songs_new ( '
+                'id integer primary key, '
+                'title text, '
+                'artist text, '
+                'album text, '
+                'comment text, '
+                'genre text, '
+                'year text, '
+                'track integer, '
+                'length integer, '
+                'filename text not null, '
+                'mtime integer, '
+                'size integer, '
+                'inode integer '
+                ')')
+    sql.execute('create unique index songs_filename on songs_new (filename)')
+    sql.execute('insert or ignore into songs_new (title, artist, album, '
+                'comment, genre, year, track, length, filename, mtime, size, '
+                'inode) select title, artist, album, comment, genre, year, '
+                'track, length, filename, mtime, size, inode from songs '
+                'where filename is not null')
+    sql.execute('drop table songs')
+    sql.execute('alter table songs_new rename to songs')
+    sql.execute('create index songs_artist_album_track on songs '
+                '(artist, album, track)')
+
+    # Statistics of songs follow their file in the songs table
+    sql.execute('create table stats_songs_new ( '
+                'filename text primary key references songs (filename) '
+                'on update cascade on delete cascade, '
+                'tracks integer not null default 0 )')
+    sql.execute('insert or ignore into stats_songs_new (filename, tracks) '
+                'select filename, tracks from stats_songs where filename in '
+                '(select filename from songs)')
+    sql.execute('drop table stats_songs')
+    sql.execute('alter table stats_songs_new rename to stats_songs')
+
+    # Albums were only known by their name, find back their artists. The
+    # play count of a name shared by several artists can't be assigned to
+    # any of them and is lost
+    sql.execute('create table stats_albums_new ( '
+                'artist text not null, '
+                'album text not null, '
+                'tracks integer not null default 0, '
+                'primary key (artist, album) )')
+    sql.execute('insert or ignore into stats_albums_new (artist, album, '
+                'tracks) select min(songs.artist), stats_albums.album, '
+                'stats_albums.tracks from stats_albums join songs on '
+                'songs.album = stats_albums.album group by '
+                'stats_albums.album, stats_albums.tracks having '
+                'count(distinct songs.artist) = 1')
+    sql.execute('drop table stats_albums')
+    sql.execute('alter table stats_albums_new rename to stats_albums')
+
+    sql.execute('create table stats_artists_new ( '
+                'artist text primary key, '
+                'tracks integer not null default 0 )')
+    sql.execute('insert or ignore into stats_artists_new (artist, tracks) '
+                'select artist, tracks from stats_artists')
+    sql.execute('drop table stats_artists')
+    sql.execute('alter table stats_artists_new rename to stats_artists')
+
+def fetch_queue_schema(sql):
+    """Pictures waiting to be downloaded, kept across restarts."""
+    sql.execute('create table fetch_queue ( '
+                'kind text not null, '
+                'artist text not null, '
+                'album text not null default \'\', '
+                'added integer not null, '
+                'primary key (kind, artist, album) )')
+
+def negative_cache_schema(sql):
+    """Pictures and lyrics that web services don't have."""
+    sql.execute('create table negative_cache ( '
+                'kind text not null, '
+                'key text not null, '
+                'failures integer not null, '
+                'retry_at integer not null, '
+                'primary key (kind, key) )')
+
+def search_schema(sql):
+    """Full-text index of the songs, kept in sync by triggers."""
+    try:
+        sql.execute('create virtual table songs_fts using fts5 ( '
+                    'title, artist, album, genre, '
+                    'content=\'songs\', content_rowid=\'id\', '
+                    'tokenize=\'unicode61 remove_diacritics 2\' )')
+    except OperationalError:
+        print('[DATABASE] SQLite has no FTS5, the search will be slower.')
+        return
+
+    sql.execute('create trigger songs_fts_insert after insert on songs begin '
+                'insert into songs_fts (rowid, title, artist, album, genre) '
+                'values (new.id, new.title, new.artist, new.album, '
+                'new.genre); end')
+    sql.execute('create trigger songs_fts_delete after delete on songs begin '
+                'insert into songs_fts (songs_fts, rowid, title, artist, '
+                'album, genre) values (\'delete\', old.id, old.title, '
+                'old.artist, old.album, old.genre); end')
+    sql.execute('create trigger songs_fts_update after update on songs begin '
+                'insert into songs_fts (songs_fts, rowid, title, artist, '
+                'album, genre) values (\'delete\', old.id, old.title, '
+                'old.artist, old.album, old.genre); '
+                'insert into songs_fts (rowid, title, artist, album, genre) '
+                'values (new.id, new.title, new.artist, new.album, '
+                'new.genre); end')
+    sql.execute('insert into songs_fts (songs_fts) values (\'rebuild\')')
+
+    # Artists and albums weigh more than titles, genres less
+    sql.execute('insert into songs_fts (songs_fts, rank) values (\'rank\', '
+                '\'bm25(1.0, 2.0, 2.0, 0.5)\')')
+
+# All the migrations, the schema version is the position in this list
+MIGRATIONS = [
+    initial_schema,
+    keyed_schema,
+    fetch_queue_schema,
+    negative_cache_schema,
+    search_schema,
+]
+
+def migrate(sql):
+    """Bring a database to the latest version of the schema."""
+    version = sql.execute('pragma user_version').fetchone()[0]
+
+    if version >= len(MIGRATIONS):
+        return
+
+    # Tables are rebuilt, foreign keys are checked once everything is done
+    sql.execute('pragma foreign_keys=off')
+    try:
+        for number in range(version, len(MIGRATIONS)):
+            with sql.transaction():
+                MIGRATIONS[number](sql)
+                sql.execute('pragma user_version=%d' % (number + 1))
+
+            print('[DATABASE] Upgraded songs database to version %d.' %
+                  (number + 1))
+    finally:
+        sql.execute('pragma foreign_keys=on')
+
+    if len(sql.execute('pragma foreign_key_check').fetchall()) > 0:
+        raise Exception('[SQLite] database has broken foreign keys.')
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from time import time
+
+from common.sqlite import SQLite
+
+# Seconds before asking again for something that was missing, doubled at
+# each new miss
+MISS_TTL = 3 * 24 * 3600
+MAX_MISS_TTL = 60 * 24 * 3600
+
+class NegativeCache:
+    """Remember what a web service doesn't have.
+
+    Usage:
+     covers = NegativeCache('album')
+     if not covers.is_missing(key):
+         … download it, then covers.add(key) if there is nothing …
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def is_missing(self, key):
+        """Return True if `key` was missing the last time and shouldn't be
+        asked for again yet."""
+        sql = SQLite()
+        cur = sql.execute('select retry_at from negative_cache where '
+                          'kind=:kind and key=:key',
+                          {'kind': self.kind, 'key': key})
+        miss = cur.fetchone()
+
+        return miss is not None and miss[0] > time()
+
+    def missing(self):
+        """Return the keys that shouldn't be asked for again yet."""
+        sql = SQLite()
+        cur = sql.execute('select key from negative_cache where kind=:kind '
+                          'and retry_at > :now',
+                          {'kind': self.kind, 'now': int(time())})
+
+        return set(miss[0] for miss in cur)
+
+    def add(self, key):
+        """Remember that `key` is missing, for longer at each miss."""
+        sql = SQLite()
+        with sql.transaction():
+            cur = sql.execute('select failures from negative_cache where '
+                              'kind=:kind and key=:key',
+                              {'kind': self.kind, 'key': key})
+            miss = cur.fetchone()
+
+            failures = 1
+            if miss is not None:
+                failures = miss[0] + 1
+
+            ttl = min(MISS_TTL * 2 ** min(failures - 1, 16), MAX_MISS_TTL)
+            sql.execute('insert or replace into negative_cache (kind, key, '
+                        'failures, retry_at) values (:kind, :key, '
+                        ':failures, :retry_at)',
+                        {'kind': self.kind, 'key': key, 'failures': failures,
+                         'retry_at': int(time() + ttl)})
+
+    def remove(self, key):
+        """Forget about `key`, it has been found."""
+        sql = SQLite()
+        sql.execute('delete from negative_cache where kind=:kind and '
+                    'key=:key', {'kind': self.kind, 'key': key})
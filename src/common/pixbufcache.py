@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository.GdkPixbuf import Pixbuf
+from gi.repository.GLib import Error as GLIBError
+from collections import OrderedDict
+from threading import Lock
+
+from common.thumbnails import Thumbnails
+
+# Memory used by the decoded pictures kept in the cache, in bytes
+CACHE_SIZE = 64 * 1024 * 1024
+
+class PixbufCache(object):
+    """Process-wide cache of decoded pictures.
+
+    Pixbufs are kept by (path, width, height) and the least recently used
+    ones are dropped when the cache grows over CACHE_SIZE. The same Pixbuf
+    is given to every caller, it must not be modified."""
+
+    ref = None
+    ref2 = None
+
+    def __new__(cls, *args, **kws):
+        # Singleton
+        if cls.ref is None:
+            cls.ref = object.__new__(cls)
+        return cls.ref
+
+    def __init__(self):
+        if PixbufCache.ref2 is None:
+            PixbufCache.ref2 = 42
+
+            self.thumbnails = Thumbnails()
+            self.pixbufs = OrderedDict()
+            self.size = 0
+            self.lock = Lock()
+
+    def load(self, filename, size):
+        """Return a cover or a picture scaled to fit in a square of `size`
+        pixels, or None if it can't be read."""
+        pixbuf = self.get((filename, size, size))
+        if pixbuf is None:
+            pixbuf = self.thumbnails.load(filename, size)
+            self.add((filename, size, size), pixbuf)
+
+        return pixbuf
+
+    def load_file(self, filename, width=-1, height=-1):
+        """Return a picture, scaled if a width or an height is given, or None
+        if it can't be read. Used for the images of Bluemindo."""
+        pixbuf = self.get((filename, width, height))
+        if pixbuf is None:
+            try:
+                if width == -1 and height == -1:
+                    pixbuf = Pixbuf.new_from_file(filename)
+                else:
+                    pixbuf = Pixbuf.new_from_file_at_scale(filename, width,
+                                                           height, True)
+            except GLIBError:
+                return None
+
+            self.add((filename, width, height), pixbuf)
+
+        return pixbuf
+
+    def get(self, key):
+        self.lock.acquire()
+        try:
+            pixbuf = self.pixbufs.get(key)
+            if pixbuf is not None:
+                self.pixbufs.move_to_end(key)
+            return pixbuf
+        finally:
+            self.lock.release()
+
+    def add(self, key, pixbuf):
+        if pixbuf is None:
+            return
+
+        self.lock.acquire()
+        try:
+            if key in self.pixbufs:
+                self.size -= self.pixbufs[key].get_byte_length()
+            self.pixbufs[key] = pixbuf
+            self.size += pixbuf.get_byte_length()
+
+            # Forget the least recently used pictures
+            while self.size > CACHE_SIZE and len(self.pixbufs) > 1:
+                old_key, old = self.pixbufs.popitem(last=False)
+                self.size -= old.get_byte_length()
+        finally:
+            self.lock.release()
+
+    def invalidate(self, filename):
+        """Forget all sizes of a picture that has been replaced."""
+        self.lock.acquire()
+        try:
+            for key in [key for key in self.pixbufs if key[0] == filename]:
+                self.size -= self.pixbufs.pop(key).get_byte_length()
+        finally:
+            self.lock.release()
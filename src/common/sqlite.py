@@ -15,64 +15,115 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from os.path import join, exists
+from os.path import join
+from threading import local, Lock
+from contextlib import contextmanager
 import sqlite3 as sqlite
 
 from common.config import ConfigLoader
+from common.migrations import migrate
 config = ConfigLoader()
 
+# Columns of the `songs` table describing a song, in the order used by the
+# rest of Bluemindo (the other columns are only used by the scanner)
+SONG_COLUMNS = ('title, artist, album, comment, genre, year, track, length, '
+                'filename')
+
 class SQLite(object):
-    def __init__(self): 
-        sqlfile = join(config.datadir, 'songs.db')
-        if not exists(sqlfile):
-            database_exist = False
+    """Access to the songs database.
+
+    Every SQLite() object shares the same connections: one per thread, kept
+    open for the whole session, in WAL mode so the scanning thread can write
+    while the user interface reads. Queries are committed as soon as they
+    are executed, unless they are done inside a transaction() block."""
+
+    ref = None
+    ref2 = None
+
+    def __new__(cls, *args, **kws):
+        # Singleton
+        if cls.ref is None:
+            cls.ref = object.__new__(cls)
+        return cls.ref
+
+    def __init__(self):
+        if SQLite.ref2 is None:
+            SQLite.ref2 = 42
+
+            self.sqlfile = join(config.datadir, 'songs.db')
+            self.threads = local()
+            self.lock = Lock()
+
+            self.lock.acquire()
+            try:
+                migrate(self)
+            finally:
+                self.lock.release()
+
+    def connection(self):
+        """Return the connection of the current thread, open it if needed."""
+        cx = getattr(self.threads, 'cx', None)
+
+        if cx is None:
+            # Statements are committed by SQLite itself outside of our
+            # transactions and prepared statements are kept between calls
+            cx = sqlite.connect(self.sqlfile, timeout=30,
+                                isolation_level=None, cached_statements=256)
+            cx.text_factory = str
+            cx.execute('pragma journal_mode=wal')
+            cx.execute('pragma synchronous=normal')
+            cx.execute('pragma foreign_keys=on')
+
+            self.threads.cx = cx
+            self.threads.depth = 0
+
+        return cx
+
+    @contextmanager
+    def transaction(self):
+        """Execute all the queries of a block in a single transaction.
+
+        Usage:
+         with sql.transaction():
+             sql.execute(…)
+        """
+        cx = self.connection()
+
+        if self.threads.depth == 0:
+            cx.execute('begin')
+        self.threads.depth += 1
+
+        try:
+            yield self
+        except:
+            self.threads.depth -= 1
+            if self.threads.depth == 0:
+                cx.execute('rollback')
+            raise
         else:
-            database_exist = True
-
-        self.cx = sqlite.connect(sqlfile)
-        self.cur = self.cx.cursor()
-        self.cx.text_factory = str
-
-        if not database_exist:
-            self.execute('create table songs ( '
-                         'title text, '
-                         'artist text, '
-                         'album text, '
-                         'comment text, '
-                         'genre text, '
-                         'year text, '
-                         'track integer, '
-                         'length integer, '
-                         'filename text '
-                         ')')
-
-            self.execute('create table stats_songs ( '
-                         'filename text, tracks integer )')
-
-            self.execute('create table stats_albums ( '
-                         'album text, tracks integer )')
-
-            self.execute('create table stats_artists ( '
-                         'artist text, tracks integer )')
+            self.threads.depth -= 1
+            if self.threads.depth == 0:
+                cx.execute('commit')
 
     def execute(self, sql, param=None):
         if param is not None:
-            self.cur.execute(sql, param)
+            return self.connection().execute(sql, param)
         else:
-            self.cur.execute(sql)
-
-        self.cx.commit()
-        return self.cur
+            return self.connection().execute(sql)
 
     def executemany(self, sql, param):
-        self.cur.executemany(sql, param)
-
-        self.cx.commit()
-        return self.cur
+        return self.connection().executemany(sql, param)
 
     def fetchall(self, cur):
         return cur.fetchall()
 
     def close(self):
-        self.cur.close()
-        self.cx.close()
\ No newline at end of file
+        """Close the connection of the current thread.
+
+        Only threads that are ending need to call it, it is opened again at
+        the next query."""
+        cx = getattr(self.threads, 'cx', None)
+
+        if cx is not None:
+            cx.close()
+            self.threads.cx = None
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository.GdkPixbuf import Pixbuf
+from gi.repository.GLib import Error as GLIBError
+from os.path import join, isdir, isfile
+from os import makedirs, remove, stat, rename
+from glob import glob
+from hashlib import md5
+from threading import Thread, Lock
+from queue import Queue
+
+from common.config import ConfigLoader
+
+class Thumbnails(object):
+    """On-disk cache of covers and pictures scaled to the sizes shown.
+
+    Thumbnails are PNG files stored in `thumbnails/<size>/`, named after the
+    hash of the source file path and its modification time: a picture that
+    is replaced gets new thumbnails. Missing thumbnails are written by a
+    background thread."""
+
+    ref = None
+    ref2 = None
+
+    def __new__(cls, *args, **kws):
+        # Singleton
+        if cls.ref is None:
+            cls.ref = object.__new__(cls)
+        return cls.ref
+
+    def __init__(self):
+        if Thumbnails.ref2 is None:
+            Thumbnails.ref2 = 42
+
+            self.userconf = ConfigLoader()
+            self.thumbdir = join(self.userconf.datadir, 'thumbnails')
+
+            self.lock = Lock()
+            self.pending = set()
+            self.queue = Queue()
+
+            thread = Thread(group=None, target=self.worker,
+                            name='thumbnails', args=())
+            thread.daemon = True
+            thread.start()
+
+    def get_path(self, filename, size):
+        """Return the path of the thumbnail of a picture at a size, raise
+        OSError if the picture does not exist."""
+        mtime = stat(filename).st_mtime_ns
+        source = md5(filename.encode('utf-8')).hexdigest()
+
+        return join(self.thumbdir, str(size), '%s-%d.png' % (source, mtime))
+
+    def load(self, filename, size):
+        """Return a Pixbuf of a picture scaled to fit in a square of `size`
+        pixels, or None if the picture can't be read.
+
+        The thumbnail is used when it exists, the picture is decoded and its
+        thumbnail saved in background otherwise."""
+        try:
+            thumb = self.get_path(filename, size)
+        except OSError:
+            return None
+
+        try:
+            if isfile(thumb):
+                return Pixbuf.new_from_file(thumb)
+
+            pixbuf = Pixbuf.new_from_file_at_scale(filename, size, size, True)
+        except GLIBError:
+            return None
+
+        self.schedule(filename, size, thumb, pixbuf)
+        return pixbuf
+
+    def prepare(self, filename, sizes):
+        """Write the missing thumbnails of a picture in background."""
+        for size in sizes:
+            try:
+                thumb = self.get_path(filename, size)
+            except OSError:
+                return
+
+            if not isfile(thumb):
+                self.schedule(filename, size, thumb, None)
+
+    def schedule(self, filename, size, thumb, pixbuf):
+        self.lock.acquire()
+        try:
+            if thumb in self.pending:
+                return
+            self.pending.add(thumb)
+        finally:
+            self.lock.release()
+
+        self.queue.put((filename, size, thumb, pixbuf))
+
+    def worker(self):
+        """Write the thumbnails that have been scheduled."""
+        while True:
+            filename, size, thumb, pixbuf = self.queue.get()
+
+            try:
+                self.generate(filename, size, thumb, pixbuf)
+            except (GLIBError, OSError):
+                print('[ERROR] Unable to create a thumbnail of %s' % filename)
+            finally:
+                self.lock.acquire()
+                self.pending.discard(thumb)
+                self.lock.release()
+
+    def generate(self, filename, size, thumb, pixbuf=None):
+        if pixbuf is None:
+            pixbuf = Pixbuf.new_from_file_at_scale(filename, size, size, True)
+
+        thumbdir = join(self.thumbdir, str(size))
+        if not isdir(thumbdir):
+            makedirs(thumbdir, exist_ok=True)
+
+        # Thumbnails of a previous version of the picture are now useless
+        source = thumb[:thumb.rindex('-')]
+        for old in glob(source + '-*.png'):
+            if old != thumb:
+                remove(old)
+
+        # Readers never see a thumbnail being written
+        pixbuf.savev(thumb + '.tmp', 'png', [], [])
+        rename(thumb + '.tmp', thumb)
@@ -15,20 +15,262 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from io import StringIO
-from os.path import join, exists
-from os import makedirs, remove
+from io import StringIO, BytesIO
+from os.path import join, exists, dirname
+from os import makedirs, remove, rename, fdopen
+from tempfile import mkstemp
 from re import compile as re_compile
 from base64 import b64decode
-from urllib.request import urlopen, urlretrieve
-from urllib.parse import quote
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.parse import quote, urljoin, urlsplit
 from urllib.error import HTTPError
+from collections import OrderedDict
 from threading import Lock
-from time import time, sleep
-import xml.etree.cElementTree as ElementTree
+from time import time
+from gzip import decompress as gzip_decompress
+from zlib import decompressobj, MAX_WBITS
+from codecs import getincrementaldecoder
+import xml.etree.ElementTree as ElementTree
 
 from common.config import ConfigLoader
 from common.functions import Functions
+from common.negativecache import NegativeCache
+
+# Idle connections kept open for each host
+POOL_SIZE = 4
+
+# Number of pages kept to revalidate them with the server
+CACHE_SIZE = 200
+
+MAX_REDIRECTS = 5
+
+class HTTPClient(object):
+    """Keep-alive HTTP client shared by all the web services.
+
+    Connections are kept open and reused for each host. Pages are asked
+    compressed, and the ones coming with an ETag or a Last-Modified date are
+    kept so that asking them again is a conditional request, answered with
+    a short 304 Not Modified when they didn't change."""
+
+    ref = None
+    ref2 = None
+
+    def __new__(cls, *args, **kws):
+        # Singleton
+        if cls.ref is None:
+            cls.ref = object.__new__(cls)
+        return cls.ref
+
+    def __init__(self):
+        if HTTPClient.ref2 is None:
+            HTTPClient.ref2 = 42
+
+            self.userconf = ConfigLoader()
+            self.timeout = float(self.userconf.config['Webservices']
+                                                     ['timeout'])
+
+            self.lock = Lock()
+            self.idle = {}
+            self.cache = OrderedDict()
+
+    def get(self, url, cache=True):
+        """Return the content of an URL, raise HTTPError if the server
+        answers with an error."""
+        headers = {}
+
+        self.lock.acquire()
+        try:
+            cached = self.cache.get(url)
+        finally:
+            self.lock.release()
+
+        if cached is not None:
+            etag, modified, content = cached
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if modified is not None:
+                headers['If-Modified-Since'] = modified
+
+        response, host, connection = self.open(url, headers)
+        try:
+            content = response.read()
+        except (HTTPException, OSError):
+            connection.close()
+            raise
+
+        self.release(host, connection, response)
+
+        if response.status == 304 and cached is not None:
+            return cached[2]
+
+        if response.getheader('Content-Encoding') == 'gzip':
+            content = gzip_decompress(content)
+
+        if response.status >= 400:
+            # The answer is kept, it may explain the error
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, BytesIO(content))
+
+        etag = response.getheader('ETag')
+        modified = response.getheader('Last-Modified')
+        if cache and (etag is not None or modified is not None):
+            self.lock.acquire()
+            try:
+                self.cache[url] = (etag, modified, content)
+                self.cache.move_to_end(url)
+                if len(self.cache) > CACHE_SIZE:
+                    self.cache.popitem(last=False)
+            finally:
+                self.lock.release()
+
+        return content
+
+    def stream(self, url, chunk_size=8192):
+        """Yield the content of an URL as text, chunk by chunk, raise
+        HTTPError if the server answers with an error.
+
+        The generator can be closed before the end of the content, its
+        connection is then dropped."""
+        response, host, connection = self.open(url, {})
+
+        if response.status >= 400:
+            response.read()
+            self.release(host, connection, response)
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, None)
+
+        charset = response.headers.get_content_charset() or 'utf-8'
+        try:
+            decoder = getincrementaldecoder(charset)(errors='replace')
+        except LookupError:
+            decoder = getincrementaldecoder('utf-8')(errors='replace')
+
+        inflater = None
+        if response.getheader('Content-Encoding') == 'gzip':
+            inflater = decompressobj(16 + MAX_WBITS)
+
+        complete = False
+        try:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+
+                if inflater is not None:
+                    chunk = inflater.decompress(chunk)
+                yield decoder.decode(chunk)
+
+            if inflater is not None:
+                yield decoder.decode(inflater.flush(), final=True)
+            else:
+                yield decoder.decode(b'', final=True)
+            complete = True
+        finally:
+            if complete:
+                self.release(host, connection, response)
+            else:
+                connection.close()
+
+    def download(self, url, filename):
+        """Save the content of an URL in a file."""
+        content = self.get(url, cache=False)
+
+        # Readers never see a file being written, and two downloads of the
+        # same file don't write in the same temporary file
+        fd, tmp_filename = mkstemp(dir=dirname(filename), suffix='.tmp')
+        try:
+            file_ = fdopen(fd, 'wb')
+            file_.write(content)
+            file_.close()
+            rename(tmp_filename, filename)
+        except OSError:
+            remove(tmp_filename)
+            raise
+
+    def open(self, url, headers):
+        """Send a request, following redirections, and return the response
+        with the host and the connection it came from."""
+        for i in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            host = (parts.scheme, parts.netloc)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            request_headers = {'Accept-Encoding': 'gzip',
+                               'User-Agent': 'Bluemindo'}
+            request_headers.update(headers)
+
+            response, connection = self.request(host, path, request_headers)
+
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                self.release(host, connection, response)
+                url = urljoin(url, location)
+            else:
+                return response, host, connection
+
+        raise HTTPError(url, response.status, 'Too many redirections',
+                        response.headers, None)
+
+    def request(self, host, path, headers):
+        connection = self.acquire(host)
+        try:
+            connection.request('GET', path, headers=headers)
+            return connection.getresponse(), connection
+        except (HTTPException, ConnectionError):
+            connection.close()
+        except OSError:
+            connection.close()
+            raise
+
+        # The server closed a kept-alive connection, try a new one
+        connection = self.connect(host)
+        try:
+            connection.request('GET', path, headers=headers)
+            return connection.getresponse(), connection
+        except (HTTPException, OSError):
+            connection.close()
+            raise
+
+    def connect(self, host):
+        scheme, netloc = host
+        if scheme == 'https':
+            return HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            return HTTPConnection(netloc, timeout=self.timeout)
+
+    def acquire(self, host):
+        """Return an idle connection to a host, or a new one."""
+        self.lock.acquire()
+        try:
+            connections = self.idle.get(host)
+            if connections:
+                return connections.pop()
+        finally:
+            self.lock.release()
+
+        return self.connect(host)
+
+    def release(self, host, connection, response):
+        """Keep a connection for the next requests, its response must have
+        been read."""
+        if response.will_close:
+            connection.close()
+            return
+
+        self.lock.acquire()
+        try:
+            connections = self.idle.setdefault(host, [])
+            if len(connections) < POOL_SIZE:
+                connections.append(connection)
+                return
+        finally:
+            self.lock.release()
+
+        connection.close()
+
 
 class WebServices(object):
     """A class to handles many WebServices."""
@@ -39,25 +281,46 @@ class WebServices(object):
 
     def get_xml(self, url):
         """This function downloads a file and returns an ElementTree object."""
-        req = urlopen(url)
-        content = req.read()
+        content = HTTPClient().get(url)
 
         return ElementTree.fromstring(content)
 
     def get_html(self, url):
         """This function downloads a file and returns its content."""
-        req = urlopen(url)
-        content = req.read()
+        content = HTTPClient().get(url)
 
         return content
 
+    def get_file(self, url, filename):
+        """This function downloads a file and saves it."""
+        HTTPClient().download(url, filename)
+
+
+# Error of Last.fm when it doesn't know an artist or an album
+LASTFM_NOT_FOUND = 6
 
 class LastFm(WebServices):
     """A class for Last.fm."""
 
-    def __init__(self):
+    def __init__(self, api_url='http://ws.audioscrobbler.com/2.0/'):
         self.api_key = b64decode(self.config.lastfm_key)
-        self.api_url = 'http://ws.audioscrobbler.com/2.0/'
+        self.api_url = api_url
+
+        self.artist_misses = NegativeCache('artist')
+        self.album_misses = NegativeCache('album')
+
+    def is_not_found(self, error):
+        """Return True if an HTTPError means that Last.fm doesn't know an
+        artist or an album, and not that it can't answer right now."""
+        if error.code == 404:
+            return True
+
+        try:
+            tree = ElementTree.fromstring(error.read())
+            return int(tree.find('error').get('code')) == LASTFM_NOT_FOUND
+        except (ElementTree.ParseError, AttributeError, TypeError,
+                ValueError):
+            return False
 
     def get_similar_artists(self, artist_name):
         """Get a list of similar artists."""
@@ -76,13 +339,6 @@ class LastFm(WebServices):
 
         return artists_list
 
-    def get_artists_pictures(self, artists):
-        """Get a picture for all artists."""
-        print ('[ARTIST_PICTURES] downloading %d artists' % len(artists))
-        for artist in artists:
-            self.get_artist_picture(artist)
-            sleep(2)
-
     def get_artist_picture(self, artist_name):
         """Get a picture for an artist."""
         url = (self.api_url + '?method=artist.getinfo&artist=%s&api_key=%s' %
@@ -101,31 +357,34 @@ class LastFm(WebServices):
             self.lock.release()
 
         if not exists(artist_file):
+            if self.artist_misses.is_missing(hash_a):
+                return None
+
             try:
                 tree = self.get_xml(url)
 
                 artist = tree.find('artist')
-                images = artist.getiterator('image')
+                images = artist.iter('image') if artist is not None else []
                 for img in images:
                     if img.attrib['size'] == 'large':
                         artist_image = img.text
                         if artist_image is not None:
                             print ('[RETRIEVED] artist_downloading '+
                                    artist_name)
-                            urlretrieve(artist_image, artist_file)
+                            self.get_file(artist_image, artist_file)
+                            self.artist_misses.remove(hash_a)
                             return artist_file
-            except HTTPError:
+            except HTTPError as error:
                 print ('[HTTPError] artist_downloading ' + artist_name)
+                if not self.is_not_found(error):
+                    # Wrong key, limited or broken, ask again later
+                    return None
+
+            # Last.fm has no picture, don't ask again before a while
+            self.artist_misses.add(hash_a)
         else:
             return artist_file
 
-    def get_albums_pictures(self, albums):
-        """Get a picture for all albums."""
-        print ('[ALBUM_PICTURES] downloading %d albums' % len(albums))
-        for album in albums:
-            self.get_album_picture(album[0], album[1])
-            sleep(2)
-
     def get_album_picture(self, artist_name, album_name):
         """Get a picture for an album."""
         url = (self.api_url +
@@ -147,20 +406,30 @@ class LastFm(WebServices):
             self.lock.release()
 
         if not exists(album_file):
+            if self.album_misses.is_missing(hash_a):
+                return None
+
             try:
                 tree = self.get_xml(url)
 
                 album = tree.find('album')
-                images = album.getiterator('image')
+                images = album.iter('image') if album is not None else []
                 for img in images:
                     if img.attrib['size'] == 'mega':
                         album_image = img.text
                         if album_image is not None:
                             print ('[RETRIEVED] cover_downloading '+
                                    artist_name, album_name)
-                            urlretrieve(album_image, album_file)
+                            self.get_file(album_image, album_file)
+                            self.album_misses.remove(hash_a)
                             return album_file
-            except HTTPError:
+            except HTTPError as error:
                 print ('[HTTPError] cover_downloading ' + artist_name, album_name)
+                if not self.is_not_found(error):
+                    # Wrong key, limited or broken, ask again later
+                    return None
+
+            # Last.fm has no cover, don't ask again before a while
+            self.album_misses.add(hash_a)
         else:
             return album_file
\ No newline at end of file
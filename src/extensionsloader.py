@@ -76,6 +76,10 @@ class ExtensionsLoader(object):
             # When a new album is queued to the playlist.
             # Args: an Album() object
 
+            'OnUpcomingSongs': list(),
+            # When the songs that will be played next are known.
+            # Args: a list of Song() objects
+
             ############
             # PLAYBACK #
             ############
@@ -95,6 +99,11 @@ class ExtensionsLoader(object):
             'OnAbortPlayback': list(),
             # Send to abort playback.
 
+            'OnPositionChanged': list(),
+            # Send the position in the song being played, a few times per
+            # second while playing.
+            # Args: position in seconds
+
             ####################
             # DBUS/API SIGNALS #
             ####################
@@ -127,10 +127,12 @@ class MPRIS(dbusobj):
             'CanGoPrevious',
             'LoopStatus',
             'PlaybackStatus',
+            'Position',
             'Metadata'
         ]
 
         self.playing = 'Stopped'
+        self.position = 0
         self.song = None
         self.widgets = None
 
@@ -152,6 +154,7 @@ class MPRIS(dbusobj):
 
         def stop_pressed():
             self.playing = 'Stopped'
+            self.position = 0
 
             self.launch_dbus_signal(INTERFACE_P_NAME, ['PlaybackStatus'])
 
@@ -160,6 +163,10 @@ class MPRIS(dbusobj):
 
             self.launch_dbus_signal(INTERFACE_P_NAME, ['PlaybackStatus'])
 
+        def position_changed(position):
+            # Not signaled, clients ask for it
+            self.position = position
+
         def bluemindo_started(widgets):
             self.widgets = widgets
 
@@ -172,6 +179,7 @@ class MPRIS(dbusobj):
         extensions.connect('OnAbortPlayback', stop_pressed)
         extensions.connect('OnPreviousPressed', prevnext_pressed)
         extensions.connect('OnNextPressed', prevnext_pressed)
+        extensions.connect('OnPositionChanged', position_changed)
         extensions.connect('OnBluemindoStarted', bluemindo_started)
 
     # Properties methods
@@ -291,6 +299,10 @@ class MPRIS(dbusobj):
     def PlaybackStatus(self):
         return self.playing
 
+    @property
+    def Position(self):
+        return dbus_int64(self.position * 1000000)
+
     @property
     def LoopStatus(self):
         return 'Playlist'
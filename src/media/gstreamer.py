@@ -20,6 +20,10 @@ from urllib import request
 from os.path import exists
 
 from gi.repository import Gst as gst
+from gi.repository.GObject import timeout_add, source_remove
+
+# Default number of position updates per second
+POSITION_RATE = 2
 
 class GStreamer(object):
     ref = None
@@ -38,6 +42,25 @@ class GStreamer(object):
             self.status = 'NULL'
             self.player = None
 
+            # Gapless playback: the song queued in the playbin before the end
+            # of the current one, and whether it has just started
+            self.queued = None
+            self.gapless_started = False
+
+            # Callbacks of the player: get_next_song() returns the filename
+            # of the next song or None, on_song_changed(filename) is called
+            # when a queued song starts, on_song_ended() at the end of a song
+            # nothing was queued after
+            self.get_next_song = None
+            self.on_song_changed = None
+            self.on_song_ended = None
+
+            # Position reporting: on_position_changed(seconds) is called
+            # every `position_interval` milliseconds while playing
+            self.on_position_changed = None
+            self.position_interval = 1000 // POSITION_RATE
+            self.position_id = None
+
     def set_playback(self, playback):
         # Gstreamer initialization
         gst.init(None)
@@ -50,6 +73,9 @@ class GStreamer(object):
             bus.add_signal_watch()
             bus.connect('message', self.on_message)
 
+            if playback == 'gapless':
+                self.player.connect('about-to-finish', self.on_about_to_finish)
+
             # ReplayGain
             if (gst.ElementFactory.find('rgvolume') and
                 gst.ElementFactory.find('rglimiter')):
@@ -91,6 +117,10 @@ class GStreamer(object):
         # Huh, we can't do anything
         elif song == None and self.status == 'STOP':
             return 42
+        # This song already started without gap
+        elif song == self.nowplaying and self.gapless_started:
+            self.gapless_started = False
+            return self.status
         else:
             # Launch this song
             if self.nowplaying is not None:
@@ -101,12 +131,17 @@ class GStreamer(object):
 
     def stop(self):
         # Stop listening
+        self.stop_position_reporting()
         self.player.set_state(gst.State.NULL)
         self.nowplaying = None
+        self.queued = None
+        self.gapless_started = False
         self.status = 'STOP'
 
     def launch(self, song):
         self.nowplaying = song
+        self.queued = None
+        self.gapless_started = False
 
         # Launch a song by URI
         song = request.pathname2url(song)
@@ -128,6 +163,31 @@ class GStreamer(object):
         # Return the position in the song
         return self.player.query_position(gst.Format.TIME)[1]
 
+    def set_position_rate(self, rate):
+        # Number of position updates per second, the default one is used
+        # for a rate of 0 or less
+        if rate <= 0:
+            rate = POSITION_RATE
+        self.position_interval = max(1, int(1000 / rate))
+
+    def start_position_reporting(self):
+        if self.position_id is None:
+            self.position_id = timeout_add(self.position_interval,
+                                           self.report_position)
+
+    def stop_position_reporting(self):
+        if self.position_id is not None:
+            source_remove(self.position_id)
+            self.position_id = None
+
+    def report_position(self):
+        if self.on_position_changed is not None:
+            found, position = self.player.query_position(gst.Format.TIME)
+            if found:
+                self.on_position_changed(position / gst.SECOND)
+
+        return True
+
     def seek(self, seconds):
         # Go to a position in the song
         value = int(gst.SECOND * seconds)
@@ -141,18 +201,50 @@ class GStreamer(object):
         else:
             return
 
-    def on_message(self, bus, message):
-        # Handle Gstreamer messages
-        if self.playback == 'gapless':
+    def on_about_to_finish(self, player):
+        # Called from a streaming thread: queue the next song right now so
+        # the playbin goes on with it without stopping
+        if self.get_next_song is None:
+            return
+
+        song = self.get_next_song()
+        if song is None or not exists(song):
             return
 
+        self.queued = song
+        self.player.set_property('uri', 'file://' + request.pathname2url(song))
+
+    def on_message(self, bus, message):
+        # Handle Gstreamer messages
         _type = message.type
-        if _type == gst.MESSAGE_EOS:
-            self.player.set_state(gst.STATE_NULL)
+        if _type == gst.MessageType.STATE_CHANGED:
+            if message.src == self.player:
+                old, new, pending = message.parse_state_changed()
+                if new == gst.State.PLAYING:
+                    self.start_position_reporting()
+                else:
+                    self.stop_position_reporting()
+
+        elif _type == gst.MessageType.STREAM_START:
+            if self.queued is not None:
+                self.nowplaying = self.queued
+                self.queued = None
+                self.gapless_started = True
+
+                if self.on_song_changed is not None:
+                    self.on_song_changed(self.nowplaying)
+
+        elif _type == gst.MessageType.EOS:
+            self.stop_position_reporting()
+            self.player.set_state(gst.State.NULL)
             self.status = 'NULL'
 
-        elif _type == gst.MESSAGE_ERROR:
-            self.player.set_state(gst.STATE_NULL)
+            if self.on_song_ended is not None:
+                self.on_song_ended()
+
+        elif _type == gst.MessageType.ERROR:
+            self.stop_position_reporting()
+            self.player.set_state(gst.State.NULL)
             self.nowplaying = None
             self.status = 'NULL'
             err, debug = message.parse_error()
@@ -17,17 +17,20 @@
 
 from common.sqlite import SQLite
 from models.song import Song
+from models.statistics import Statistics
 
 class Album:
     """ Album() object """
 
     kind = 'album'
 
-    def __init__(self, artist_name, album_name, songs_tree):
+    def __init__(self, artist_name, album_name, songs_tree, statistics=None):
         """Initialization of the Album() model class.
 
         Usage:
          alb = Album('Artist', 'Album name', songs_tree)
+        or, with play counts already loaded for many albums:
+         alb = Album('Artist', 'Album name', songs_tree, Statistics())
         """
 
         self.__is_loaded = False
@@ -40,12 +43,15 @@ class Album:
 
         self.__is_loaded = True
 
-        alb.sort(key=lambda item: item[6])
+        alb = sorted(alb, key=lambda item: item[6])
 
         self.name = album_name
         self.artist = artist_name
         self.tracks = []
-        self.statistics = self.__get_statistics()
+
+        if statistics is None:
+            statistics = Statistics(artist_name, album_name)
+        self.statistics = statistics.album(artist_name, album_name)
 
         for sng in alb:
             self.tracks.append(Song(title=sng[0],
@@ -56,46 +62,23 @@ class Album:
                                     year=sng[5],
                                     track=sng[6],
                                     length=sng[7],
-                                    filename=sng[8]
+                                    filename=sng[8],
+                                    statistics=statistics.song(sng[8])
                               ))
 
-    def __get_statistics(self):
-        if self.__is_loaded:
-            sql = SQLite()
-            cur_nb = sql.execute('select * from stats_albums where ' +
-                                 'album=:album', {'album': self.name})
-            song = cur_nb.fetchone()
-
-            if song is not None:
-                times_played = song[1]
-            else:
-                times_played = 0
-
-            sql.close()
-            return times_played
-        else:
-            raise Exception('[Album] object was not loaded.')
-
     def increment_statistics(self):
         if self.__is_loaded:
-            sql_insert = [
-                'insert into stats_albums (album, tracks) values (?, ?)',
-                [self.name, int(self.statistics + 1)]
-            ]
-
-            sql_update = [
-                'update stats_albums set tracks=:value where album=:album',
-                {'album': self.name, 'value': int(self.statistics + 1)}
-            ]
-
+            # The same album may have been played through other objects, the
+            # stored count is the right one
             sql = SQLite()
-            if self.statistics == 0:
-                sql.execute(sql_insert[0], sql_insert[1])
-            else:
-                sql.execute(sql_update[0], sql_update[1])
-
-            self.statistics = int(self.statistics + 1)
-
-            sql.close()
+            params = {'artist': self.artist, 'album': self.name}
+            with sql.transaction():
+                sql.execute('insert into stats_albums (artist, album, tracks) '
+                            'values (:artist, :album, 1) on conflict (artist, '
+                            'album) do update set tracks=tracks + 1', params)
+                cur = sql.execute('select tracks from stats_albums where '
+                                  'artist=:artist and album=:album', params)
+
+                self.statistics = cur.fetchone()[0]
         else:
             raise Exception('[Album] object was not loaded.')
\ No newline at end of file
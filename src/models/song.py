@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from common.sqlite import SQLite
+from common.sqlite import SQLite, SONG_COLUMNS
 
 class Song:
     """ Song() object """
@@ -29,6 +29,9 @@ class Song:
          sng = Song(filename='/foo/whatever.flac')
         or:
          sng = Song(title='Foo', artist='Bar'…)
+
+        The play count can be given with `statistics`, it is queried
+        otherwise.
         """
 
         self.__is_loaded = False
@@ -38,8 +41,8 @@ class Song:
 
             # Try to load a Song() object with the filename.
             sql = SQLite()
-            cur_nb = sql.execute('select * from songs where filename=:file',
-                                 {'file': filename})
+            cur_nb = sql.execute('select ' + SONG_COLUMNS + ' from songs '
+                                 'where filename=:file', {'file': filename})
             song_sql = cur_nb.fetchone()
 
             if song_sql is not None:
@@ -55,8 +58,6 @@ class Song:
                 self.year = song_sql[5]
                 self.filename = song_sql[8]
                 self.statistics = self.__get_statistics()
-
-            sql.close()
         else:
             keys = ['title', 'artist', 'album', 'track', 'length', 'comment',
                     'genre', 'year', 'filename']
@@ -76,45 +77,41 @@ class Song:
             self.genre = kwargs['genre']
             self.year = kwargs['year']
             self.filename = kwargs['filename']
-            self.statistics = self.__get_statistics()
+
+            if 'statistics' in kwargs.keys():
+                self.statistics = kwargs['statistics']
+            else:
+                self.statistics = self.__get_statistics()
 
     def __get_statistics(self):
         if self.__is_loaded:
             sql = SQLite()
-            cur_nb = sql.execute('select * from stats_songs where ' +
+            cur_nb = sql.execute('select tracks from stats_songs where ' +
                                  'filename=:file', {'file': self.filename})
             song = cur_nb.fetchone()
 
             if song is not None:
-                times_played = song[1]
+                times_played = song[0]
             else:
                 times_played = 0
 
-            sql.close()
             return times_played
         else:
             raise Exception('[Song] object was not loaded.')
 
     def increment_statistics(self):
         if self.__is_loaded:
-            sql_insert = [
-                'insert into stats_songs (filename, tracks) values (?, ?)',
-                [self.filename, int(self.statistics + 1)]
-            ]
-
-            sql_update = [
-                'update stats_songs set tracks=:value where filename=:file',
-                {'file': self.filename, 'value': int(self.statistics + 1)}
-            ]
-
+            # The same song may have been played through other objects, the
+            # stored count is the right one
             sql = SQLite()
-            if self.statistics == 0:
-                sql.execute(sql_insert[0], sql_insert[1])
-            else:
-                sql.execute(sql_update[0], sql_update[1])
-
-            self.statistics = int(self.statistics + 1)
-
-            sql.close()
+            with sql.transaction():
+                sql.execute('insert into stats_songs (filename, tracks) '
+                            'values (:file, 1) on conflict (filename) do '
+                            'update set tracks=tracks + 1',
+                            {'file': self.filename})
+                cur = sql.execute('select tracks from stats_songs where '
+                                  'filename=:file', {'file': self.filename})
+
+                self.statistics = cur.fetchone()[0]
         else:
             raise Exception('[Song] object was not loaded.')
\ No newline at end of file
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from common.sqlite import SQLite
+
+class Statistics:
+    """ Statistics() object """
+
+    def __init__(self, artist_name=None, album_name=None, counts=None):
+        """Initialization of the Statistics() model class.
+
+        Play counts are loaded in bulk, for the whole library or for only
+        one album, and given to the Song() and Album() objects.
+
+        Usage:
+         stats = Statistics()
+        or:
+         stats = Statistics('Artist', 'Album name')
+        or, with play counts already read, by filename and (artist, album):
+         stats = Statistics(counts=(songs, albums))
+        """
+
+        self.songs = {}
+        self.albums = {}
+
+        if counts is not None:
+            self.songs, self.albums = counts
+            return
+
+        sql = SQLite()
+        if album_name is None:
+            cur_sg = sql.execute('select filename, tracks from stats_songs')
+            cur_al = sql.execute('select artist, album, tracks from '
+                                 'stats_albums')
+        else:
+            params = {'artist': artist_name, 'album': album_name}
+            cur_sg = sql.execute('select stats_songs.filename, '
+                                 'stats_songs.tracks from songs join '
+                                 'stats_songs on stats_songs.filename = '
+                                 'songs.filename where songs.artist=:artist '
+                                 'and songs.album=:album', params)
+            cur_al = sql.execute('select artist, album, tracks from '
+                                 'stats_albums where artist=:artist and '
+                                 'album=:album', params)
+
+        for (filename, tracks) in cur_sg:
+            self.songs[filename] = tracks
+
+        for (artist, album, tracks) in cur_al:
+            self.albums[(artist, album)] = tracks
+
+    def song(self, filename):
+        """Return how many times a song has been played."""
+        return self.songs.get(filename, 0)
+
+    def album(self, artist_name, album_name):
+        """Return how many times an album has been played."""
+        return self.albums.get((artist_name, album_name), 0)
@@ -22,6 +22,7 @@ from gi.repository.Gdk import threads_enter, threads_leave
 from gi.repository.GdkPixbuf import Pixbuf
 from gi.repository.GObject import markup_escape_text, idle_add
 from threading import Thread
+from time import time
 from os.path import join
 from random import randrange
 from sys import exit
@@ -47,6 +48,7 @@ class Explorer:
 
         self.songs_tree = {}
         self.albums = {}
+        self.database = []
 
         # Create the Albums view
         def launch_explorer(wdg):
@@ -136,7 +138,8 @@ class Explorer:
 
                 # Do the scanning
                 pb = win.get_object('progressbar')
-                musicdb.scan(lbl, pb)
+                incremental = self.userconf.config['Explorer']['incremental_scan']
+                musicdb.scan(lbl, pb, not bool(int(incremental)))
 
                 # Show original GUI
                 idle_add(self.widgets[0][2].set_sensitive, True)
@@ -154,13 +157,29 @@ class Explorer:
         threads_leave()
 
     def create_view(self):
+        """Load the library in a thread, the view is then filled in
+        progressively so the window is usable right away."""
+        self.load_started = time()
+
+        thread = Thread(group=None, target=self.load_view,
+                        name='loading', args=())
+        thread.start()
+
+    def load_view(self):
         # Call database
         musicdb = MusicDatabase(self.userconf.config['Explorer']['folder'])
-        self.database = musicdb.load()
 
-        self.albums_tree = []
-        album_names = []
-        album_iter = {}
+        # Create the tree artists→albums→songs
+        database = musicdb.load_index()
+        idle_add(print, '[LOAD] Loaded %d songs in %.2fs.' %
+                 (len(database), time() - self.load_started))
+
+        idle_add(self.show_view, database)
+
+    def show_view(self, database):
+        self.database = database
+        self.songs_tree = self.database.songs_tree
+        self.albums_tree = self.database.albums_tree
 
         # Activate player buttons
         self.widgets[0][5].set_sensitive(True)
@@ -168,65 +187,20 @@ class Explorer:
         self.widgets[0][7].set_sensitive(True)
         self.widgets[0][8].set_sensitive(True)
 
-        # Create the tree artists→albums→songs
-        def unique(seq, keepstr=True):
-            """This function ensures there are only unique values."""
-            t = type(seq)
-            if t in (str, str):
-                t = (list, ''.join)[bool(keepstr)]
-            seen = []
-            return t(c for c in seq if not (c in seen or seen.append(c)))
-
-        # Create the songs tree
-        songs_tree = {}
-        artists = []
-        albums = []
-        albums_dl = []
-
-        for result in self.database:
-            artists.append(result[1])
-            albums.append((result[1], result[2]))
-
-        artists = unique(artists)
-        albums = unique(albums)
-
-        for a in artists:
-            songs_tree[a] = {}
-
-        for a in albums:
-            songs_tree[a[0]][a[1]] = []
-
-        # Add songs
-        for result in self.database:
-            songs_tree[result[1]][result[2]].append(result)
-
-        # Sort songs
-        for artist in songs_tree.values():
-            for album in artist.values():
-                album.sort(key=lambda student: student[3])
-
-        self.songs_tree = songs_tree
-
-        i = 0
-        for art in self.songs_tree:
-            for alb in self.songs_tree[art]:
-                album_names.append(alb)
-                self.albums_tree.append({'album': alb, 'artist': art})
-                i = i + 1
-
-        # Sort everything
-        self.albums_tree.sort(key=lambda item: item['album'].lower())
-        self.albums_tree.sort(key=lambda item: item['artist'].lower())
-
         # Send the music tree to all extensions
         self.extensions.load_event('OnSongsTreeCreated', self.songs_tree)
 
         # Launch explorer GUI
-        self.search.generate_autocompletion(artists, albums, self.songs_tree)
-        self.aview.populate_albums(self.albums_tree, self.albums, self.songs_tree, self.search)
+        self.aview.populate_albums(self.albums_tree, self.albums,
+                                   self.songs_tree, self.search,
+                                   self.view_populated, self.load_started)
+
+    def view_populated(self):
+        self.search.generate_autocompletion(self.database.artists,
+                                            self.database.albums,
+                                            self.songs_tree)
         self.filter.launch(self.albums_tree, self.songs_tree, self.aview)
 
-
     def shuffle_song_asked(self):
         if len(self.database) > 1:
             index = randrange(len(self.database))
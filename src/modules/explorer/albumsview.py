@@ -21,17 +21,24 @@ from gi.repository.Gtk import (ListStore, FileChooserDialog, ResponseType,
                                ReliefStyle, Popover)
 from gi.repository.Gdk import Display
 from gi.repository.GdkPixbuf import Pixbuf
-from gi.repository.GObject import timeout_add
+from gi.repository.Gio import File, FileMonitorFlags, FileMonitorEvent
+from gi.repository.GObject import timeout_add, idle_add
+from threading import Thread
+from time import time
 from os.path import join, isfile
 from shutil import copyfile
-from hashlib import md5
 
 from common.functions import Functions
 from common.config import ConfigLoader
 from common.webservices import LastFm
+from common.pixbufcache import PixbufCache
+from modules.explorer.facets import FacetIndex, from_bitset
 
 from models.album import Album
 
+# Number of albums added to the view at once while it is populated
+ALBUMS_CHUNK = 100
+
 class AlbumsView:
     def __init__(self, widgets, extensions):
         self.widgets = widgets
@@ -39,11 +46,21 @@ class AlbumsView:
 
         self.functions = Functions()
         self.userconf = ConfigLoader()
+        self.pixbufs = PixbufCache()
         self.dblclick = None
+        self.populate_id = 0
+        self.covers_rows = {}
+        self.albums_rows = {}
+
+        # Covers are downloaded or changed while the view is shown
+        bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
+        self.covers_monitor = File.new_for_path(bdir).monitor_directory(
+                                            FileMonitorFlags.WATCH_MOVES, None)
+        self.covers_monitor.connect('changed', self.on_cover_changed)
 
         # Create the IconView
         self.albumview = self.widgets[1].get_object('albumview')
-        self.albummodel = ListStore(Pixbuf, str, str, str, int, str, str)
+        self.albummodel = ListStore(Pixbuf, str, str, str, int, bool)
 
         self.albumview.set_pixbuf_column(0)
         self.albumview.set_markup_column(1)
@@ -53,57 +70,17 @@ class AlbumsView:
         self.albumview.set_item_width(100)
         self.albumview.set_property('activate-on-single-click', False)
 
-        # Add a filter to the ListStore model
+        # Add a filter to the ListStore model, the visibility of every album
+        # is stored in its row and only changed for the albums that appear
+        # or disappear
         self.albumfilter = self.albummodel.filter_new(None)
-        self.remove_filter_data()
+        self.albumfilter.set_visible_column(5)
+        self.facets = None
+        self.visible = None
         self.matched = False
+        self.search_results = None
+        self.filter_data = {'genre': None, 'year': None}
 
-        def filter_visible(model, iter, data):
-            usrf = self.widgets[1].get_object('searchentry').get_text()
-            search_a = model.get_value(iter, 3)
-            search_b = model.get_value(iter, 2)
-            pre_result = False
-
-            if self.matched:
-                usrf_a = self.matched[0]
-                usrf_b = self.matched[1]
-
-                if usrf_b == 'blm.!ARTIST!':
-                    if usrf_a.lower() == search_b.lower():
-                        # Matched an artist
-                        pre_result = True
-                else:   
-                    if (usrf_a.lower() == search_a.lower() and
-                        usrf_b.lower() == search_b.lower()):
-                        # Matched an album
-                        pre_result = True
-            else:
-                if len(model) > 0:
-                    if (usrf.lower() in search_a.lower() or
-                        usrf.lower() in search_b.lower()):
-                        # Found an element (artist or album name is close)
-                        pre_result = True
-                    else:
-                        # No element founded at all, return False anyway
-                        return False
-
-            # Apply filters
-            fdg = self.filter_data['genre']
-            fdy = self.filter_data['year']
-
-            # Filter results by genres
-            if fdg is not None and fdg != model.get_value(iter, 5):
-                pre_result = False
-
-            # Filter results by years
-            if fdy is not None and fdy != model.get_value(iter, 6):
-                pre_result = False
-
-            # Return the final result
-            return pre_result
-
-
-        self.albumfilter.set_visible_func(filter_visible)
         self.albumview.set_model(self.albumfilter)
 
         # Connect to signals
@@ -119,7 +96,14 @@ class AlbumsView:
         self.albumview.connect('selection_changed', self.on_selection_changed)
 
 
-    def populate_albums(self, albums_tree, albums, songs_tree, search):
+    def populate_albums(self, albums_tree, albums, songs_tree, search,
+                        callback=None, started=None):
+        """Show the albums in the view.
+
+        Covers are decoded in a thread and the albums are added to the view
+        by chunks from the main loop, so the window stays responsive and
+        fills in progressively. `callback` is called once every album is
+        shown."""
         self.albums_tree = albums_tree
         self.albums = albums
         self.songs_tree = songs_tree
@@ -127,62 +111,174 @@ class AlbumsView:
 
         # Clear the tree model first
         self.albummodel.clear()
+        self.albums.clear()
+        self.covers_rows = {}
+        self.albums_rows = {}
+        self.facets = FacetIndex(albums_tree)
+        self.visible = self.get_visible()
+
+        # Forget about the chunks of a previous population still coming
+        self.populate_id += 1
+        if started is None:
+            started = time()
+
+        thread = Thread(group=None, target=self.load_albums, name='albums',
+                        args=(self.populate_id, albums_tree, callback, started))
+        thread.start()
+
+    def load_albums(self, populate_id, albums_tree, callback, started):
+        """Prepare the rows of the view, this runs in a thread."""
+        facets = self.facets
+        bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
 
-        # Show albums in the main explorer view
-        self.album_nf = []
+        # Show albums in the main explorer view, Album() objects are only
+        # built when the user opens, plays or queues them
+        chunk = []
         album_id = 0
-        for alb in self.albums_tree:
-            bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
+        for alb in albums_tree:
+            if populate_id != self.populate_id:
+                return
+
             album = alb['album']
             artist = alb['artist']
 
             cover = join(bdir, self.functions.get_hash(album, artist))
+            cover_px = None
             if isfile(cover):
-                cover_px = Pixbuf.new_from_file_at_scale(cover, 150, 150, True)
-            else:
-                cover_px = Pixbuf.new_from_file(join(self.functions.datadir,
-                                                'image', 'logo_head_big.png'))
+                cover_px = self.pixbufs.load(cover, 150)
+
+            if cover_px is None:
+                cover_px = self.pixbufs.load_file(join(self.functions.datadir,
+                                                       'image',
+                                                       'logo_head_big.png'))
+
+            chunk.append(([cover_px, '<b>' +
+                           self.functions.view_encode(album) +
+                           '</b>\n<span foreground="grey">' +
+                           self.functions.view_encode(artist) +
+                           '</span>',
+                           artist, album, album_id, True], cover))
+            album_id += 1
 
-            self.albums[album_id] = Album(artist, album, self.songs_tree)
+            if len(chunk) == ALBUMS_CHUNK:
+                idle_add(self.append_albums, populate_id, chunk, started)
+                chunk = []
 
-            ap = self.albummodel.append([cover_px, '<b>' +
-                                        self.functions.view_encode(album) +
-                                        '</b>\n<span foreground="grey">' +
-                                        self.functions.view_encode(artist) +
-                                        '</span>',
-                                        artist, album, album_id, '', ''])
-            album_id += 1
+        idle_add(self.append_albums, populate_id, chunk, started)
+
+        # Genres and years of the albums, for the filters
+        genres, years = facets.read()
+        idle_add(self.facets_read, populate_id, genres, years)
 
-            if not isfile(cover):
-                self.album_nf.append([cover, ap, None])
+        idle_add(self.albums_populated, populate_id, callback, started)
 
-        # Check if we have to regenerate thumbnail (cover not found at startup)
-        if len(self.album_nf) > 0:
-            def regenerate_thumb():
-                new_album = []
+    def append_albums(self, populate_id, chunk, started):
+        """Add a chunk of albums to the view."""
+        if populate_id != self.populate_id:
+            return
+
+        first_chunk = len(self.albummodel) == 0
+
+        for (row, cover) in chunk:
+            row[5] = self.is_visible(row[4])
+            item_iter = self.albummodel.append(row)
+            self.covers_rows[cover] = item_iter
+            self.albums_rows[(row[2], row[3])] = item_iter
 
-                for alb in self.album_nf:
-                    if isfile(alb[0]):
-                        item_iter = alb[1]
+        if first_chunk and len(chunk) > 0:
+            print('[LOAD] First albums shown after %.2fs.' %
+                  (time() - started))
 
-                        cover_md5 = md5(open(alb[0], 'rb').read()).hexdigest()
+    def facets_read(self, populate_id, genres, years):
+        """The genres and years of the albums can be filtered."""
+        if populate_id != self.populate_id:
+            return
 
-                        if alb[2] == None or alb[2] != cover_md5:
-                            cover_px = Pixbuf.new_from_file_at_scale(alb[0],
-                                                                     150, 150,
-                                                                     True)
-                            self.albummodel.set_value(item_iter, 0, cover_px)
-                            alb[2] = cover_md5
-                            new_album.append(alb)
-                    else:
-                        new_album.append(alb)
+        self.facets.load(genres, years)
+        self.update_visible()
 
-                if len(new_album) > 0:
-                    self.album_nf = new_album
-                    return True
+    def albums_populated(self, populate_id, callback, started):
+        """All the albums are in the view."""
+        if populate_id != self.populate_id:
+            return
 
-            timeout_add(15000, regenerate_thumb)
+        print('[LOAD] %d albums shown after %.2fs.' % (len(self.albummodel),
+                                                        time() - started))
 
+        if callback is not None:
+            callback()
+
+    def on_cover_changed(self, monitor, file_, other_file, event_type):
+        """A cover has been downloaded or replaced, update its album."""
+        if event_type == FileMonitorEvent.RENAMED:
+            file_ = other_file
+        elif event_type not in (FileMonitorEvent.CHANGES_DONE_HINT,
+                                FileMonitorEvent.MOVED_IN):
+            return
+
+        cover = file_.get_path()
+        item_iter = self.covers_rows.get(cover)
+        if item_iter is None:
+            return
+
+        self.pixbufs.invalidate(cover)
+        cover_px = self.pixbufs.load(cover, 150)
+        if cover_px is not None:
+            self.albummodel.set_value(item_iter, 0, cover_px)
+
+    def is_visible(self, album_id):
+        return (self.visible >> album_id) & 1 == 1
+
+    def get_visible(self):
+        """Return the bitset of the albums matching the search and the
+        filters."""
+        visible = self.facets.all
+
+        if self.matched:
+            if self.matched[1] == 'blm.!ARTIST!':
+                visible &= self.facets.get_artist(self.matched[0])
+            else:
+                visible &= self.facets.get_album(self.matched[1],
+                                                 self.matched[0])
+        elif self.search_results is not None:
+            visible &= self.facets.get_albums(self.search_results)
+
+        # Genres and years can't be filtered before being loaded
+        if not self.facets.loaded:
+            return visible
+
+        if self.filter_data['genre'] is not None:
+            visible &= self.facets.get_genre(self.filter_data['genre'])
+
+        if self.filter_data['year'] is not None:
+            visible &= self.facets.get_year(self.filter_data['year'])
+
+        return visible
+
+    def update_visible(self):
+        """Show and hide the albums whose visibility changed."""
+        if self.facets is None:
+            return
+
+        visible = self.get_visible()
+        changed = self.visible ^ visible
+        self.visible = visible
+
+        for album_id in from_bitset(changed):
+            alb = self.albums_tree[album_id]
+            item_iter = self.albums_rows.get((alb['artist'], alb['album']))
+            if item_iter is not None:
+                self.albummodel.set_value(item_iter, 5,
+                                          self.is_visible(album_id))
+
+    def get_album(self, album_id):
+        """Return the Album() object of an album, built at the first call."""
+        if album_id not in self.albums:
+            alb = self.albums_tree[album_id]
+            self.albums[album_id] = Album(alb['artist'], alb['album'],
+                                          self.songs_tree)
+
+        return self.albums[album_id]
 
     def on_album_matched(self, album):
         for item in self.albummodel:
@@ -207,7 +303,7 @@ class AlbumsView:
             popup.set_pointing_to(rect)
 
             album_id = self.albumfilter.get_value(treeiter, 4)
-            album_obj = self.albums[album_id]
+            album_obj = self.get_album(album_id)
         else:
             album_obj = album
             popup.set_relative_to(self.search_entry)
@@ -237,11 +333,13 @@ class AlbumsView:
 
         bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
         cover = join(bdir, self.functions.get_hash(album, artist))
+        default = join(self.functions.datadir, 'image', 'logo_head_big.png')
+        cover_px = None
         if isfile(cover):
-            cover_px = Pixbuf.new_from_file_at_scale(cover, 180, 180, True)
-        else:
-            cover_px = Pixbuf.new_from_file(join(self.functions.datadir,
-                                            'image', 'logo_head_big.png'))
+            cover_px = self.pixbufs.load(cover, 180)
+
+        if cover_px is None:
+            cover_px = self.pixbufs.load_file(default)
 
         box.get_object('album_cover').set_from_pixbuf(cover_px)
 
@@ -270,8 +368,11 @@ class AlbumsView:
                 album_file = join(pictures_dir, hash_a)
 
                 copyfile(filename, album_file)
+                self.pixbufs.invalidate(album_file)
 
-                new = Pixbuf.new_from_file_at_scale(album_file, 180, 180, True)
+                new = self.pixbufs.load(album_file, 180)
+                if new is None:
+                    new = self.pixbufs.load_file(default)
                 box.get_object('album_cover').set_from_pixbuf(new)
 
             fcdialog.destroy()
@@ -373,25 +474,13 @@ class AlbumsView:
         else:
             self.extensions.load_event('OnSongQueued', usrobject)
 
-    def generate_filter_data(self, album_data):
-        for element in self.albummodel:
-            artist = element[2]
-            album = element[3]
-
-            datalb = album_data[artist][album]
-            datalb_genre = datalb['genre']
-            datalb_year = datalb['year']
-
-            element[5] = datalb_genre
-            element[6] = datalb_year
-
     def add_filter_data(self, value, field):
         self.filter_data[field] = value
-        self.albumfilter.refilter()
+        self.update_visible()
 
     def remove_filter_data(self, cmb=None):
         if cmb is None:
             self.filter_data = {'genre': None, 'year': None}
         else:
             self.filter_data[cmb] = None
-        self.albumfilter.refilter()
\ No newline at end of file
+        self.update_visible()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from common.sqlite import SQLite
+from modules.explorer.library import leading_number
+
+def to_bitset(ids, size):
+    """Return an integer where the bit of every id of `ids` is set."""
+    bits = bytearray((size + 7) // 8)
+    for album_id in ids:
+        bits[album_id >> 3] |= 1 << (album_id & 7)
+
+    return int.from_bytes(bytes(bits), 'little')
+
+def from_bitset(bitset):
+    """Yield the ids set in a bitset."""
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+class FacetIndex:
+    """Albums of each artist, genre and year, as bitsets of album ids.
+
+    The id of an album is its position in the albums tree, so combining
+    the search and the filters is a matter of intersecting integers."""
+
+    def __init__(self, albums_tree):
+        self.size = len(albums_tree)
+        self.all = (1 << self.size) - 1
+
+        # Albums of an artist are built in a bitset when first asked
+        self.ids = {}
+        self.lowered_ids = {}
+        self.artists_ids = {}
+        self.artists = {}
+        for (album_id, alb) in enumerate(albums_tree):
+            artist = alb['artist']
+            album = alb['album']
+
+            self.ids[(artist, album)] = album_id
+            self.lowered_ids.setdefault((artist.lower(), album.lower()),
+                                        album_id)
+            self.artists_ids.setdefault(artist.lower(), []).append(album_id)
+
+        # Genres and years are only known once loaded
+        self.loaded = False
+        self.genres = {}
+        self.years = {}
+
+    def get_facet(self, values):
+        return dict((value, to_bitset(ids, self.size))
+                    for (value, ids) in values.items())
+
+    def read(self):
+        """Return the bitsets of the genres and of the years, an album having
+        those of its first songs with one. Years are numbers as in the
+        library. This reads every song so it runs in a thread."""
+        genres = {}
+        years = {}
+        album_genre = {}
+        album_year = {}
+
+        cur = SQLite().execute('select artist, album, genre, year from songs '
+                               'order by artist, album, track')
+        for (artist, album, genre, year) in cur:
+            album_id = self.ids.get((artist, album))
+            if album_id is None:
+                continue
+
+            if genre and album_id not in album_genre:
+                album_genre[album_id] = genre
+                genres.setdefault(genre, []).append(album_id)
+
+            year = leading_number(year)
+            if year != 0 and album_id not in album_year:
+                album_year[album_id] = year
+                years.setdefault(str(year), []).append(album_id)
+
+        return (self.get_facet(genres), self.get_facet(years))
+
+    def load(self, genres, years):
+        """Use the genres and the years read by read()."""
+        self.genres = genres
+        self.years = years
+        self.loaded = True
+
+    def get_albums(self, albums):
+        """Return the bitset of some (artist, album)."""
+        return to_bitset((self.ids[album] for album in albums
+                          if album in self.ids), self.size)
+
+    def get_artist(self, artist):
+        artist = artist.lower()
+
+        bitset = self.artists.get(artist)
+        if bitset is None:
+            bitset = to_bitset(self.artists_ids.get(artist, []), self.size)
+            self.artists[artist] = bitset
+
+        return bitset
+
+    def get_album(self, artist, album):
+        album_id = self.lowered_ids.get((artist.lower(), album.lower()))
+        if album_id is None:
+            return 0
+
+        return 1 << album_id
+
+    def get_genre(self, genre):
+        return self.genres.get(genre, 0)
+
+    def get_year(self, year):
+        return self.years.get(year, 0)
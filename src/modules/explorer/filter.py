@@ -23,11 +23,10 @@ from os.path import join
 from common.functions import Functions
 from common.config import ConfigLoader
 
-from models.album import Album
-
 class Filter:
     def __init__(self, widgets, aview):
         self.widgets = widgets
+        self.aview = aview
 
         self.functions = Functions()
         self.userconf = ConfigLoader()
@@ -64,6 +63,14 @@ class Filter:
         self.year_fcombo.set_entry_text_column(1)
         self.year_fcombo.add_attribute(renderer_text, 'text', 1)
 
+        def combo_sep(model, iter):
+            if model[iter][0] == -1:
+                return True
+        self.year_fcombo.set_row_separator_func(combo_sep)
+        self.genre_fcombo.set_row_separator_func(combo_sep)
+
+        self.genre_fcombo.connect('changed', self.on_fcombo_changed, 'genre')
+        self.year_fcombo.connect('changed', self.on_fcombo_changed, 'year')
 
     def on_button_clicked(self, widget):
         if self.filter_box.props.visible is True:
@@ -80,49 +87,14 @@ class Filter:
         self.songs_tree = songs_tree
         self.aview = aview
 
-        album_data = {}
-        data_genre = []
-        data_year = []
-
-        # Gather data
-        for item in self.albums_tree:
-            item_artist = item['artist']
-            item_album = item['album']
-
-            if item_artist not in album_data.keys():
-                album_data[item_artist] = {}
-
-            album_data[item_artist][item_album] = {}
-
-            album = Album(item_artist, item_album, self.songs_tree)
-
-            album_genre = ''
-            album_year = ''
-
-            for sng in album.tracks:
-                if album_genre == '':
-                    album_genre = sng.genre
-
-                if album_year == '':
-                    album_year = sng.year
-
-            if album_genre != '' and album_genre not in data_genre:
-                data_genre.append(album_genre)
-
-            if album_year != '' and album_year not in data_year:
-                data_year.append(album_year)
-
-            album_data[item_artist][item_album]['genre'] = album_genre
-            album_data[item_artist][item_album]['year'] = album_year
-
-        # Populate combobox
+        # Populate combobox, the genres and years of the albums are read by
+        # the facets of the view while loading the albums
         self.genre_fstore.clear()
         self.genre_fstore.append([-2, _('All genres')])
         self.genre_fstore.append([-1, ''])
 
-        data_genre.sort()
         i = 0
-        for genre in data_genre:
+        for genre in sorted(self.aview.facets.genres):
             self.genre_fstore.append([i, genre])
             i += 1
 
@@ -130,23 +102,11 @@ class Filter:
         self.year_fstore.append([-2, _('All years')])
         self.year_fstore.append([-1, ''])
 
-        data_year.sort()
         i = 0
-        for year in data_year:
+        for year in sorted(self.aview.facets.years, key=int):
             self.year_fstore.append([i, year])
             i += 1
 
-        def combo_sep(model, iter):
-            if model[iter][0] == -1:
-                return True
-        self.year_fcombo.set_row_separator_func(combo_sep)
-        self.genre_fcombo.set_row_separator_func(combo_sep)
-
-        self.aview.generate_filter_data(album_data)
-
-        self.genre_fcombo.connect('changed', self.on_fcombo_changed, 'genre')
-        self.year_fcombo.connect('changed', self.on_fcombo_changed, 'year')
-
         # Hide filters
         self.filter_box.hide()
         self.filter_button.set_active(False)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+from collections.abc import Mapping, Sequence
+from re import compile as re_compile
+from sys import intern
+
+number_regxp = re_compile('[0-9]{1,9}')
+
+def leading_number(value):
+    """Return the number a tag starts with (`3/12` → 3), 0 if none."""
+    match = number_regxp.match(str(value or ''))
+    if match is None:
+        return 0
+
+    return int(match.group())
+
+class LibraryIndex(Sequence):
+    """The whole music library, kept in memory in a compact way.
+
+    Artists, albums, comments and genres are interned and only stored once,
+    songs reference them by identifier. Tracks, lengths and years are kept
+    in arrays of integers. Songs are read through SongRow() views that look
+    like the rows of the `songs` table, and the tree artists→albums→songs is
+    a read-only mapping over ranges of songs.
+
+    Rows have to be given ordered by artist, album then track."""
+
+    def __init__(self, rows):
+        self.strings = []
+        string_ids = {}
+
+        def string_id(value):
+            value = value or ''
+            identifier = string_ids.get(value)
+            if identifier is None:
+                identifier = len(self.strings)
+                string_ids[value] = identifier
+                self.strings.append(intern(value))
+            return identifier
+
+        self.titles = []
+        self.filenames = []
+        self.artist_ids = array('I')
+        self.album_ids = array('I')
+        self.comment_ids = array('I')
+        self.genre_ids = array('I')
+        self.years = array('I')
+        self.tracks = array('I')
+        self.lengths = array('I')
+
+        # Each album is a range of songs: {artist: {album: (start, stop)}}
+        tree = {}
+        self.albums_tree = []
+        self.albums = []
+
+        artist_name = None
+        album_name = None
+        position = 0
+        for song in rows:
+            self.titles.append(song[0])
+            self.artist_ids.append(string_id(song[1]))
+            self.album_ids.append(string_id(song[2]))
+            self.comment_ids.append(string_id(song[3]))
+            self.genre_ids.append(string_id(song[4]))
+            self.years.append(leading_number(song[5]))
+            self.tracks.append(leading_number(song[6]))
+            self.lengths.append(int(song[7] or 0))
+            self.filenames.append(song[8])
+
+            # Songs are grouped by artist then album, a new group starts when
+            # one of them changes
+            if song[1] != artist_name:
+                artist_name = self.strings[self.artist_ids[-1]]
+                album_name = None
+                artist = tree.setdefault(artist_name, {})
+
+            if song[2] != album_name:
+                album_name = self.strings[self.album_ids[-1]]
+                artist[album_name] = (position, position)
+
+                self.albums_tree.append({'album': album_name,
+                                         'artist': artist_name})
+                self.albums.append((artist_name, album_name))
+
+            start = artist[album_name][0]
+            position += 1
+            artist[album_name] = (start, position)
+
+        self.albums_tree.sort(key=lambda item: (item['artist'].lower(),
+                                                item['album'].lower()))
+
+        self.artists = list(tree.keys())
+        self.songs_tree = SongsTree(self, tree)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [SongRow(self, pos)
+                    for pos in range(*position.indices(len(self)))]
+
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('song position out of range')
+
+        return SongRow(self, position)
+
+    def value(self, position, column):
+        """Return a column of a song, numbered as in the `songs` table."""
+        if column == 0:
+            return self.titles[position]
+        elif column == 1:
+            return self.strings[self.artist_ids[position]]
+        elif column == 2:
+            return self.strings[self.album_ids[position]]
+        elif column == 3:
+            return self.strings[self.comment_ids[position]]
+        elif column == 4:
+            return self.strings[self.genre_ids[position]]
+        elif column == 5:
+            year = self.years[position]
+            if year == 0:
+                return ''
+            return str(year)
+        elif column == 6:
+            return self.tracks[position]
+        elif column == 7:
+            return self.lengths[position]
+        elif column == 8:
+            return self.filenames[position]
+        else:
+            raise IndexError('song column out of range')
+
+class SongRow(Sequence):
+    """Read-only view of one song of a LibraryIndex()."""
+
+    __slots__ = ('index', 'position')
+
+    def __init__(self, index, position):
+        self.index = index
+        self.position = position
+
+    def __len__(self):
+        return 9
+
+    def __getitem__(self, column):
+        if isinstance(column, slice):
+            return tuple(self.index.value(self.position, col)
+                         for col in range(*column.indices(9)))
+
+        if column < 0:
+            column += 9
+
+        return self.index.value(self.position, column)
+
+    def __repr__(self):
+        return 'SongRow%r' % (tuple(self),)
+
+class SongRange(Sequence):
+    """Read-only list of the songs of an album."""
+
+    __slots__ = ('index', 'start', 'stop')
+
+    def __init__(self, index, start, stop):
+        self.index = index
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [SongRow(self.index, self.start + pos)
+                    for pos in range(*item.indices(len(self)))]
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('song position out of range')
+
+        return SongRow(self.index, self.start + item)
+
+class SongsTree(Mapping):
+    """Read-only tree artists→albums→songs of a LibraryIndex()."""
+
+    __slots__ = ('index', 'tree')
+
+    def __init__(self, index, tree):
+        self.index = index
+        self.tree = tree
+
+    def __getitem__(self, artist_name):
+        return ArtistAlbums(self.index, self.tree[artist_name])
+
+    def __contains__(self, artist_name):
+        return artist_name in self.tree
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __len__(self):
+        return len(self.tree)
+
+class ArtistAlbums(Mapping):
+    """Read-only mapping of the albums of an artist to their songs."""
+
+    __slots__ = ('index', 'albums')
+
+    def __init__(self, index, albums):
+        self.index = index
+        self.albums = albums
+
+    def __getitem__(self, album_name):
+        start, stop = self.albums[album_name]
+        return SongRange(self.index, start, stop)
+
+    def __contains__(self, album_name):
+        return album_name in self.albums
+
+    def __iter__(self):
+        return iter(self.albums)
+
+    def __len__(self):
+        return len(self.albums)
@@ -19,148 +19,225 @@ from gettext import gettext as _
 from gi.repository.GObject import idle_add
 from re import compile as re_compile
 from os.path import join
-from os import walk
+from os import walk, stat
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from taglib import File as TagLibFile
 
-from common.sqlite import SQLite
+from common.config import ConfigLoader
+from common.sqlite import SQLite, SONG_COLUMNS
+from modules.explorer.library import LibraryIndex, leading_number
+
+# Number of songs read by the scanner before being written to the database
+SCAN_BATCH = 500
+
+def file_state(filename):
+    """Return what is stored to know if a file changed between two scans."""
+    stats = stat(filename)
+    return (stats.st_mtime_ns, stats.st_size, stats.st_ino)
+
+def read_tags(filename):
+    """Read the metadata of a song, raise OSError if it can't be imported."""
+    exif = TagLibFile(filename)
+    if not all(k in exif.tags.keys() for k in ('TITLE', 'ARTIST',
+                                               'ALBUM', 'TRACKNUMBER')):
+        raise OSError
+
+    title = exif.tags['TITLE'][0]
+    artist = exif.tags['ARTIST'][0]
+    album = exif.tags['ALBUM'][0]
+    track = exif.tags['TRACKNUMBER'][0]
+
+    length = exif.length
+
+    if 'COMMENT' in exif.tags:
+        try:
+            comment = exif.tags['COMMENT'][0]
+        except IndexError:
+            comment = ''
+    else:
+        comment = ''
+
+    if 'GENRE' in exif.tags:
+        try:
+            genre = exif.tags['GENRE'][0]
+        except IndexError:
+            genre = ''
+    else:
+        genre = ''
+
+    if 'DATE' in exif.tags:
+        try:
+            year = exif.tags['DATE'][0]
+        except IndexError:
+            year = ''
+    else:
+        year = ''
+
+    return (title, artist, album, comment, genre, year, track, length,
+            filename)
+
+def import_song(filename):
+    """Read the metadata of a song, the tags are None on failure.
+
+    This is what the scanning workers run, it has to stay picklable."""
+    try:
+        return (filename, read_tags(filename))
+    except OSError:
+        return (filename, None)
 
 class MusicDatabase:
     def __init__(self, folder):
         self.folder = folder
+        self.userconf = ConfigLoader()
 
         self.stored_result = []
 
-    def do_scan(self, wdg=None):
-        """This function scan the music directory."""
-        songs = list()
-        songs_filename = list()
-        songs_artists = list()
-        songs_albums = list()
+    def do_scan(self, wdg=None, full=False):
+        """This function scan the music directory.
+
+        Only the files whose modification time, size or inode changed since
+        the last scan are read again, unless `full` is True."""
         nb_song = 0
         fileregxp = re_compile('.+\.(flac|ogg|oga|mp3)$')
 
         # Walk in the music folder
         folder = self.folder
 
-        song_files = list()
+        song_files = {}
         for (dir_, rep, files) in walk(folder):
             for file_ in files:
                 if fileregxp.match(file_):
+                    filename = join(dir_, file_)
+                    try:
+                        song_files[filename] = file_state(filename)
+                    except OSError:
+                        idle_add(print, '[ERROR] Unable to import %s' % filename)
+                        continue
                     nb_song += 1
-                    song_files.append(join(dir_, file_))
+
+        # Compare with the state stored during the previous scan
+        sqlite = SQLite()
+        cursor = sqlite.execute('select filename, mtime, size, inode '
+                                'from songs')
+        known_files = {}
+        for song in cursor.fetchall():
+            known_files[song[0]] = (song[1], song[2], song[3])
+
+        if full:
+            changed_files = list(song_files.keys())
+        else:
+            changed_files = [song for song in song_files
+                             if known_files.get(song) != song_files[song]]
+
+        deleted_files = [song for song in known_files
+                         if song not in song_files]
 
         if wdg is not None:
             idle_add(wdg[0].set_text, _('Found %d songs.' % len(song_files)))
             idle_add(wdg[1].set_fraction, 0)
 
+        # Read tags in a pool of workers, results are written by batches
+        workers = int(self.userconf.config['Explorer']['scan_workers'])
+        if workers > 1 and len(changed_files) > 1:
+            if self.userconf.config['Explorer']['scan_pool'] == 'process':
+                executor = ProcessPoolExecutor(workers)
+            else:
+                executor = ThreadPoolExecutor(workers)
+            results = executor.map(import_song, changed_files,
+                                   chunksize=max(1, SCAN_BATCH // workers))
+        else:
+            executor = None
+            results = map(import_song, changed_files)
+
+        inserted_songs = []
+        updated_songs = []
+        nb_inserted = 0
+        nb_updated = 0
         id_song = 0
         ok_song = 0
-        for song in song_files:
+        nb_changed = len(changed_files)
+        for (song, tags) in results:
             id_song += 1
 
-            try:
-                exif = TagLibFile(song)
-                if all(k in exif.tags.keys() for k in ('TITLE', 'ARTIST',
-                                                       'ALBUM', 'TRACKNUMBER')):
-                    ok_song += 1
-                    filename = song
-
-                    title = exif.tags['TITLE'][0]
-                    artist = exif.tags['ARTIST'][0]
-                    album = exif.tags['ALBUM'][0]
-                    track = exif.tags['TRACKNUMBER'][0]
-
-                    length = exif.length
-
-                    if 'COMMENT' in exif.tags:
-                        try:
-                            comment = exif.tags['COMMENT'][0]
-                        except IndexError:
-                            comment = ''
-                    else:
-                        comment = ''
-
-                    if 'GENRE' in exif.tags:
-                        try:
-                            genre = exif.tags['GENRE'][0]
-                        except IndexError:
-                            genre = ''
-                    else:
-                        genre = ''
-
-                    if 'DATE' in exif.tags:
-                        try:
-                            year = exif.tags['DATE'][0]
-                        except IndexError:
-                            year = ''
-                    else:
-                        year = ''
-
-                    if wdg is not None and id_song % 5:
-                        idle_add(wdg[1].set_fraction, float(id_song) / float(nb_song))
-                        idle_add(wdg[0].set_text, _('Added %d songs.' % id_song))
-
-                    songs_filename.append(filename)
-                    songs_artists.append(artist)
-                    songs_albums.append(album)
-
-                    songs.append((title, artist, album, comment, genre,
-                                  year, track, length, filename))
-                else:
-                    raise OSError
-            except OSError:
+            if wdg is not None and (id_song % 50 == 0 or
+                                    id_song == nb_changed):
+                idle_add(wdg[1].set_fraction, float(id_song) / float(nb_changed))
+                idle_add(wdg[0].set_text, _('Added %d songs.' % id_song))
+
+            if tags is None:
                 idle_add(print, '[ERROR] Unable to import %s' % song)
 
+                # The file is still there but can't be read anymore
+                if song in known_files:
+                    deleted_files.append(song)
+                continue
+
+            ok_song += 1
+            row = tags + song_files[song]
+            if song in known_files:
+                updated_songs.append(row)
+                nb_updated += 1
+            else:
+                inserted_songs.append(row)
+                nb_inserted += 1
+
+            if len(inserted_songs) + len(updated_songs) >= SCAN_BATCH:
+                self.write_songs(sqlite, inserted_songs, updated_songs)
+                inserted_songs = []
+                updated_songs = []
+
+        if executor is not None:
+            executor.shutdown()
+
         if wdg is not None:
             idle_add(wdg[0].set_text,
                      _('Metadata retrieved for %d songs. Updating database…' %
-                     len(songs)))
+                     nb_changed))
 
-        idle_add(print, '[RELOAD] Imported %d songs from %d founded.' %
-                (ok_song, id_song))
+        idle_add(print, '[RELOAD] Imported %d songs from %d founded '
+                        '(%d unchanged, %d new, %d updated, %d removed).' %
+                (ok_song, nb_song, nb_song - nb_changed, nb_inserted,
+                 nb_updated, len(deleted_files)))
 
         # Serialize songs
-        sqlite = SQLite()
-        sqlite.execute('delete from songs')
-        sqlite.executemany('insert into songs (title, artist, album, '
-                           'comment, genre, year, track, length, filename) '
-                           'values (?, ?, ?, ?, ?, ?, ?, ?, ?)', songs)
-
-        # Update songs
-        cursor = sqlite.execute('select * from stats_songs')
-        for song in cursor.fetchall():
-            filename = song[0]
-
-            if filename not in songs_filename:
-                # Delete this songs from statistics
-                sqlite.execute('delete from stats_songs where filename=:val',
-                               {'val': filename})
-
-        # Update artists
-        cursor = sqlite.execute('select * from stats_artists')
-        for artist in cursor.fetchall():
-            artist = artist[0]
+        with sqlite.transaction():
+            self.__write_songs(sqlite, inserted_songs, updated_songs)
+            sqlite.executemany('delete from songs where filename=?',
+                               [(song,) for song in deleted_files])
+
+            # Delete artists and albums that left the collection from
+            # statistics, songs statistics are removed with their song
+            sqlite.execute('delete from stats_artists where not exists '
+                           '(select 1 from songs where '
+                           'songs.artist = stats_artists.artist)')
+            sqlite.execute('delete from stats_albums where not exists '
+                           '(select 1 from songs where '
+                           'songs.artist = stats_albums.artist and '
+                           'songs.album = stats_albums.album)')
 
-            if artist not in songs_artists:
-                # Delete this artist from statistics
-                sqlite.execute('delete from stats_artists where artist=:val',
-                               {'val': artist})
+        # The job is ended o/
+        sqlite.close()
 
-        # Update albums
-        cursor = sqlite.execute('select * from stats_albums')
-        for album in cursor.fetchall():
-            album = album[0]
+    def write_songs(self, sqlite, inserted_songs, updated_songs):
+        """Store a batch of songs read by the scanner."""
+        with sqlite.transaction():
+            self.__write_songs(sqlite, inserted_songs, updated_songs)
 
-            if album not in songs_albums:
-                # Delete this album from statistics
-                sqlite.execute('delete from stats_albums where album=:val',
-                               {'val': album})
+    def __write_songs(self, sqlite, inserted_songs, updated_songs):
+        sqlite.executemany('insert into songs (title, artist, album, '
+                           'comment, genre, year, track, length, filename, '
+                           'mtime, size, inode) '
+                           'values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           inserted_songs)
 
-        # The job is ended o/
-        sqlite.close()
+        sqlite.executemany('update songs set title=?, artist=?, album=?, '
+                           'comment=?, genre=?, year=?, track=?, length=?, '
+                           'mtime=?, size=?, inode=? where filename=?',
+                           [row[:8] + row[9:] + row[8:9]
+                            for row in updated_songs])
 
-    def scan(self, lbl, pbar):
-        self.do_scan([lbl, pbar])
+    def scan(self, lbl, pbar, full=False):
+        self.do_scan([lbl, pbar], full)
 
     def load(self, force_reload=False):
         if not force_reload and len(self.stored_result) > 0:
@@ -169,19 +246,27 @@ class MusicDatabase:
         else:
             # Load the songs
             sqlite = SQLite()
-            cursor = sqlite.execute('select * from songs order by '
-                                    'artist, album, title')
+            cursor = sqlite.execute('select ' + SONG_COLUMNS + ' from songs '
+                                    'order by artist, album, title')
             songs = cursor.fetchall()
-            sqlite.close()
 
             return songs
 
+    def load_index(self):
+        """Load the songs in a compact LibraryIndex(), which also holds the
+        tree artists→albums→songs and the albums sorted for the explorer
+        view, built in one pass over a single ordered query."""
+        sqlite = SQLite()
+        cursor = sqlite.execute('select ' + SONG_COLUMNS + ' from songs '
+                                'order by artist, album, track')
+
+        return LibraryIndex(cursor)
+
     def artist_exists(self, artist_name):
         sqlite = SQLite()
         cursor = sqlite.execute('select count(*) from songs where artist=:val',
                                 {'val': artist_name})
         songs = cursor.fetchall()
-        sqlite.close()
 
         answer = songs[0][0]
         if answer > 0:
@@ -189,9 +274,50 @@ class MusicDatabase:
 
     def load_from_artist(self, artist_name):
         sqlite = SQLite()
-        cursor = sqlite.execute('select * from songs where artist=:val ' +
+        cursor = sqlite.execute('select ' + SONG_COLUMNS + ' from songs '
+                                'where artist=:val ' +
                                 ' order by album, title', {'val': artist_name})
         songs = cursor.fetchall()
-        sqlite.close()
 
-        return songs
\ No newline at end of file
+        return songs
+
+    def load_from_filenames(self, filenames):
+        """Return the songs of a list of files, in the same order and with
+        their play count, and the files that are not in the library. Tracks
+        are numbers, as in the library index.
+
+        The files are joined to the songs through a temporary table, so
+        they are all resolved with one query."""
+        sqlite = SQLite()
+        columns = ', '.join('songs.' + column
+                            for column in SONG_COLUMNS.split(', '))
+
+        with sqlite.transaction():
+            sqlite.execute('create temp table if not exists wanted_files ( '
+                           'position integer primary key, '
+                           'filename text not null )')
+            sqlite.executemany('insert into wanted_files (filename) '
+                               'values (?)', [(filename,)
+                                              for filename in filenames])
+
+            cursor = sqlite.execute('select wanted_files.filename, songs.id, ' +
+                                    columns + ', ifnull(stats_songs.tracks, '
+                                    '0) from wanted_files left join songs on '
+                                    'songs.filename = wanted_files.filename '
+                                    'left join stats_songs on '
+                                    'stats_songs.filename = songs.filename '
+                                    'order by wanted_files.position')
+            rows = cursor.fetchall()
+
+            sqlite.execute('delete from wanted_files')
+
+        songs = []
+        missing = []
+        for row in rows:
+            if row[1] is None:
+                missing.append(row[0])
+            else:
+                songs.append(row[2:8] + (leading_number(row[8]),) + row[9:])
+
+        return (songs, missing)
+
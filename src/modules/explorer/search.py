@@ -19,17 +19,28 @@ from gettext import gettext as _
 from gi.repository.Gtk import (ListStore, EntryCompletion, CellRendererPixbuf,
                                CellRendererText, Builder as gtk_builder)
 from gi.repository.GdkPixbuf import Pixbuf
-from gi.repository.GLib import Error as GLIBError
-from threading import Thread
+from gi.repository.GObject import timeout_add, source_remove
+from time import time
 from os.path import join, isfile, exists
+from os import listdir
 
 from common.functions import Functions
 from common.config import ConfigLoader
-from common.webservices import LastFm
+from common.fetcher import FetchScheduler
+from common.pixbufcache import PixbufCache
+from modules.explorer.searchindex import SearchIndex
 
 from models.song import Song
 from models.album import Album
 
+# Milliseconds without typing before searching
+SEARCH_DELAY = 150
+
+# Number of artists, albums and songs proposed by the autocompletion
+COMPLETION_ARTISTS = 3
+COMPLETION_ALBUMS = 5
+COMPLETION_SONGS = 10
+
 class Search:
     def __init__(self, widgets, aview):
         self.widgets = widgets
@@ -41,12 +52,20 @@ class Search:
 
         self.functions = Functions()
         self.userconf = ConfigLoader()
+        self.pixbufs = PixbufCache()
+        self.index = SearchIndex()
 
         # Create the autocompletion columns
         self.completion_model = ListStore(Pixbuf, str, str, str, str, str,
                                           str, str)
         ecomplet = EntryCompletion()
         ecomplet.set_model(self.completion_model)
+        self.ecomplet = ecomplet
+
+        # The model only holds the best matches of the search
+        def match_all(completion, key, iter, data=None):
+            return True
+        ecomplet.set_match_func(match_all, None)
 
         pixbufcell = CellRendererPixbuf()
         ecomplet.pack_start(pixbufcell, False)
@@ -74,7 +93,7 @@ class Search:
             data_b = item[5]
 
             self.aview.matched = [data_a, data_b]
-            self.albumfilter.refilter()
+            self.aview.update_visible()
 
             if data_b == 'blm.!ARTIST!':
                 # Matched an artist: show albums
@@ -109,128 +128,158 @@ class Search:
         searchentry.grab_focus()
 
         def do_filter(widget):
-            self.albumfilter.refilter() 
-            self.aview.matched = False
+            if self.aview.matched:
+                # An item of the completion was chosen, show it right away
+                self.cancel_search()
+                self.aview.update_visible()
+                self.aview.matched = False
+                return
+
+            # Wait for the user to stop typing
+            if self.typed_at is None:
+                self.typed_at = time()
+
+            self.cancel_search()
+            self.search_id = timeout_add(SEARCH_DELAY, self.run_search,
+                                         widget.get_text())
 
         searchentry.connect('changed', do_filter)
         self.searchentry = searchentry
 
+        self.search_id = None
+        self.typed_at = None
+        self.songs_tree = None
 
-    def generate_autocompletion(self, artists, albums, songs_tree):
-        self.songs_tree = songs_tree
+    def cancel_search(self):
+        if self.search_id is not None:
+            source_remove(self.search_id)
+            self.search_id = None
 
-        albums_without_cover = []
-        artists_without_picture = []
+    def run_search(self, query):
+        """Show the albums matching a query, only the albums that appear or
+        disappear are updated by the view."""
+        self.search_id = None
 
-        # Launch autocompletion now that the songs tree is generated
-        def append_autocompletion(name, kind):
-            fnf = join(self.functions.datadir, 'image', 'logo_head_big.png')
+        self.aview.search_results = self.index.search_albums(query)
+        self.aview.update_visible()
+        self.update_completion(query)
 
-            if kind == 1:
-                # Artist
-                icon = 'face-smile-symbolic'
+        print('[SEARCH] %d albums shown %.0f ms after typing.' %
+              (len(self.albumfilter), (time() - self.typed_at) * 1000))
+        self.typed_at = None
 
-                pic = join(self.userconf.datadir, 'modules', 'explorer',
-                           'artists', self.functions.get_hash(name, 'picture'))
+        return False
 
-                try:
-                    if isfile(pic):
-                        pxbf = Pixbuf.new_from_file_at_scale(pic, 70, 70, True)
-                    else:
-                        pxbf = Pixbuf.new_from_file_at_scale(fnf, 70, 70, True)
-                        artists_without_picture.append(name)
-                except GLIBError:
-                    pxbf = Pixbuf.new_from_file_at_scale(fnf, 70, 70, True)
+    def generate_autocompletion(self, artists, albums, songs_tree):
+        self.songs_tree = songs_tree
+        self.completion_model.clear()
+
+        # Retrieve album covers and artist pictures
+        bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
+        covers = set(listdir(bdir))
+        albums_without_cover = [[artist, album] for (artist, album) in albums
+                                if self.functions.get_hash(album, artist)
+                                not in covers]
+
+        pdir = join(self.userconf.datadir, 'modules', 'explorer', 'artists')
+        pictures = set(listdir(pdir))
+        artists_without_picture = [artist for artist in artists
+                                   if self.functions.get_hash(artist,
+                                                              'picture')
+                                   not in pictures]
+
+        fetcher = FetchScheduler()
+        fetcher.fetch_albums(albums_without_cover)
+        fetcher.fetch_artists(artists_without_picture)
+
+    def update_completion(self, query):
+        """Fill the autocompletion with the best artists, albums and songs
+        matching a query, their pictures are only loaded for them."""
+        self.completion_model.clear()
+        if self.songs_tree is None:
+            return
+
+        for name in self.index.search_artists_names(query, COMPLETION_ARTISTS):
+            if name in self.songs_tree:
+                self.completion_model.append(self.get_artist_row(name))
 
-                dname = '<b>' + self.functions.view_encode(name, 99) + '</b>'
+        for (artist, name) in self.index.search_albums_names(query,
+                                                             COMPLETION_ALBUMS):
+            if artist in self.songs_tree and name in self.songs_tree[artist]:
+                self.completion_model.append(self.get_album_row(artist, name))
 
-                infos = ('<b>' + _('Artist') + '</b>\n' +
-                         _('%s albums in collection.' % ('<b>' +
-                         str(len(self.songs_tree[name])) + '</b>')))
+        for song in self.index.search_songs(query, COMPLETION_SONGS):
+            self.completion_model.append(self.get_song_row(song))
 
-                add = 'blm.!ARTIST!'
-                add_a = ''
-                add_b = ''
-            elif kind == 2:
-                # Album
-                icon = 'media-optical-symbolic'
+        if len(self.completion_model) > 0 and self.searchentry.has_focus():
+            self.ecomplet.complete()
 
-                artist = name[0]
-                name = name[1]
+    def get_picture(self, picture):
+        pxbf = None
+        if isfile(picture):
+            pxbf = self.pixbufs.load(picture, 70)
 
-                cover = join(self.userconf.datadir, 'modules', 'player',
-                             'covers', self.functions.get_hash(name, artist))
-                if isfile(cover):
-                    pxbf = Pixbuf.new_from_file_at_scale(cover, 70, 70, True)
-                else:
-                    pxbf = Pixbuf.new_from_file_at_scale(fnf, 70, 70, True)
-                    albums_without_cover.append([artist, name])
+        if pxbf is None:
+            fnf = join(self.functions.datadir, 'image', 'logo_head_big.png')
+            pxbf = self.pixbufs.load_file(fnf, 70, 70)
 
-                dname = ('<b>' + self.functions.view_encode(name, 99) +
-                         '</b>\n<i>' + self.functions.view_encode(artist, 99) +
-                         '</i>')
+        return pxbf
 
-                length = 0
-                songs = 0
-                for song in self.songs_tree[artist][name]:
-                    songs += 1
-                    length += song[7]
+    def get_artist_row(self, name):
+        icon = 'face-smile-symbolic'
 
-                hlgth = self.functions.human_length(length)
-                infos = (_('%s songs' % ('<b>' + str(songs) + '</b>')) + '\n' +
-                         _('Total playing time: %s.' % ('<i>' + hlgth + '</i>')
-                        ))
+        pic = join(self.userconf.datadir, 'modules', 'explorer',
+                   'artists', self.functions.get_hash(name, 'picture'))
+        pxbf = self.get_picture(pic)
 
-                self.cur_pxbf = pxbf
+        dname = '<b>' + self.functions.view_encode(name, 99) + '</b>'
 
-                add = artist
-                add_a = ''
-                add_b = ''
-            elif kind == 3:
-                # Song
-                icon = 'media-record-symbolic'
+        infos = ('<b>' + _('Artist') + '</b>\n' +
+                 _('%s albums in collection.' % ('<b>' +
+                 str(len(self.songs_tree[name])) + '</b>')))
 
-                artist = name[1]
-                album = name[2]
+        return [pxbf, dname, infos, icon, name, 'blm.!ARTIST!', '', '']
 
-                add = name[8]
-                add_a = artist
-                add_b = album
+    def get_album_row(self, artist, name):
+        icon = 'media-optical-symbolic'
 
-                name = name[0]
+        cover = join(self.userconf.datadir, 'modules', 'player',
+                     'covers', self.functions.get_hash(name, artist))
+        pxbf = self.get_picture(cover)
 
-                dname = ('<b>' + self.functions.view_encode(name, 99) +
-                         '</b>\n<i>' + self.functions.view_encode(artist, 99) +
-                         ' - ' + self.functions.view_encode(album, 99) +
-                         '</i>')
+        dname = ('<b>' + self.functions.view_encode(name, 99) +
+                 '</b>\n<i>' + self.functions.view_encode(artist, 99) +
+                 '</i>')
 
-                infos = '<b>' + _('Song') + '</b>'
+        length = 0
+        songs = 0
+        for song in self.songs_tree[artist][name]:
+            songs += 1
+            length += song[7]
 
-                pxbf = self.cur_pxbf
+        hlgth = self.functions.human_length(length)
+        infos = (_('%s songs' % ('<b>' + str(songs) + '</b>')) + '\n' +
+                 _('Total playing time: %s.' % ('<i>' + hlgth + '</i>')
+                ))
 
-            self.completion_model.append([pxbf, dname, infos, icon, name, add,
-                                          add_a, add_b])
+        return [pxbf, dname, infos, icon, name, artist, '', '']
 
-        self.completion_model.clear()
+    def get_song_row(self, song):
+        icon = 'media-record-symbolic'
 
-        for a in artists:
-            append_autocompletion(a, 1)
+        name = song[0]
+        artist = song[1]
+        album = song[2]
 
-        for a in albums:
-            append_autocompletion(a, 2)
+        cover = join(self.userconf.datadir, 'modules', 'player',
+                     'covers', self.functions.get_hash(album, artist))
+        pxbf = self.get_picture(cover)
 
-            for sng in self.songs_tree[a[0]][a[1]]:
-                append_autocompletion(sng, 3)
+        dname = ('<b>' + self.functions.view_encode(name, 99) +
+                 '</b>\n<i>' + self.functions.view_encode(artist, 99) +
+                 ' - ' + self.functions.view_encode(album, 99) +
+                 '</i>')
 
-        # Retrieve album covers
-        lastfm = LastFm()
-        thread = Thread(group=None, target=lastfm.get_albums_pictures,
-                        name='coverart',
-                        kwargs={'albums': albums_without_cover})
-        thread.start()
+        infos = '<b>' + _('Song') + '</b>'
 
-        # Retrieve artist pictures
-        thread = Thread(group=None, target=lastfm.get_artists_pictures,
-                        name='coverart',
-                        kwargs={'artists': artists_without_picture})
-        thread.start()
\ No newline at end of file
+        return [pxbf, dname, infos, icon, name, song[8], artist, album]
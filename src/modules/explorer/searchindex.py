@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from re import compile as re_compile
+
+from common.sqlite import SQLite, SONG_COLUMNS
+
+words_regxp = re_compile('\\w+')
+
+class SearchIndex:
+    """Search the songs by title, artist, album and genre.
+
+    Every word of the query has to match the beginning of a word of the
+    song, whatever the case and the accents, best matches first. The
+    `songs_fts` full-text index is used, or LIKE queries when SQLite has no
+    FTS5."""
+
+    def __init__(self):
+        sql = SQLite()
+        cur = sql.execute('select count(*) from sqlite_master where '
+                          'name=\'songs_fts\'')
+        self.fts = cur.fetchone()[0] > 0
+
+    def get_words(self, query):
+        return words_regxp.findall(query)
+
+    def match(self, words, fields=None):
+        """Return the condition and the parameters for a list of words,
+        searched in some `fields` or in all of them."""
+        if self.fts:
+            phrase = ' '.join('"%s"*' % word for word in words)
+            if fields is not None:
+                phrase = '{%s} : (%s)' % (' '.join(fields), phrase)
+
+            return ('songs_fts match ?', [phrase])
+        else:
+            if fields is None:
+                fields = ('title', 'artist', 'album', 'genre')
+
+            condition = []
+            params = []
+            for word in words:
+                condition.append('(' + ' or '.join('songs.%s like ?' % field
+                                                   for field in fields) + ')')
+                params.extend(['%' + word + '%'] * len(fields))
+
+            return (' and '.join(condition), params)
+
+    def execute(self, columns, words, fields=None, group=None, limit=None):
+        condition, params = self.match(words, fields)
+
+        if self.fts:
+            txt = ('select ' + columns + ' from songs_fts join songs on '
+                   'songs.id = songs_fts.rowid where ' + condition)
+        else:
+            txt = 'select ' + columns + ' from songs where ' + condition
+
+        if group is not None:
+            txt += ' group by ' + group
+
+        # The rank of the index is bm25() weighted by column
+        if self.fts and group is not None:
+            txt += ' order by min(songs_fts.rank)'
+        elif self.fts:
+            txt += ' order by songs_fts.rank'
+
+        if limit is not None:
+            txt += ' limit %u' % limit
+
+        return SQLite().execute(txt, params)
+
+    def search_albums(self, query):
+        """Return the set of (artist, album) having songs matching a query,
+        None if the query has no word."""
+        words = self.get_words(query)
+        if len(words) == 0:
+            return None
+
+        cur = self.execute('songs.artist, songs.album', words,
+                           group='songs.artist, songs.album')
+
+        return set((artist, album) for (artist, album) in cur)
+
+    def search_artists_names(self, query, limit):
+        """Return the best artists whose name matches a query."""
+        words = self.get_words(query)
+        if len(words) == 0:
+            return []
+
+        cur = self.execute('songs.artist', words, fields=('artist',),
+                           group='songs.artist', limit=limit)
+
+        return [artist[0] for artist in cur]
+
+    def search_albums_names(self, query, limit):
+        """Return the best (artist, album) whose names match a query."""
+        words = self.get_words(query)
+        if len(words) == 0:
+            return []
+
+        cur = self.execute('songs.artist, songs.album', words,
+                           fields=('artist', 'album'),
+                           group='songs.artist, songs.album', limit=limit)
+
+        return cur.fetchall()
+
+    def search_songs(self, query, limit=None):
+        """Return the best songs matching a query, as rows of the `songs`
+        table."""
+        words = self.get_words(query)
+        if len(words) == 0:
+            return []
+
+        columns = ', '.join('songs.' + column
+                            for column in SONG_COLUMNS.split(', '))
+        cur = self.execute(columns, words, limit=limit)
+
+        return cur.fetchall()
@@ -16,20 +16,20 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from gettext import gettext as _
-from gi.repository.GObject import idle_add, timeout_add
 from gi.repository.Gio import ThemedIcon
 from gi.repository.Gtk import (Image, IconSize, Builder as gtk_builder,
                                Popover, ScrolledWindow, TextView, TextBuffer,
                                Spinner, Box)
-from gi.repository.GdkPixbuf import Pixbuf
 from os.path import join, isfile, exists
 from os import remove as os_remove
 from threading import Thread
 
 from common.functions import Functions
 from common.config import ConfigLoader
+from common.pixbufcache import PixbufCache
 from media.gstreamer import GStreamer
 from modules.player.lyrics import LyricsDownloader
+from modules.player.prefetcher import Prefetcher
 
 class Player:
     def __init__(self, extensionsloader):
@@ -39,18 +39,26 @@ class Player:
 
         self.functions = Functions()
         self.userconf = ConfigLoader()
+        self.pixbufs = PixbufCache()
 
         self.lyrics_downloader = LyricsDownloader()
+        self.prefetcher = Prefetcher()
 
         def start_playback(wdg):
             # Create GStreamer instance
             self.gst = GStreamer()
             self.gst.set_playback('gapless')
-            self.gst.player.connect('about-to-finish', self.song_nearly_ended)
+            self.gst.get_next_song = self.get_next_song
+            self.gst.on_song_changed = self.on_gapless_song
+            self.gst.on_song_ended = self.on_song_ended
+            self.gst.on_position_changed = self.on_position_changed
+            rate = float(self.userconf.config['Player']['position_rate'])
+            self.gst.set_position_rate(rate)
             self.gst.stop()
 
             self.current_song = False
             self.current_album = False
+            self.upcoming_song = None
 
             # Prepare buttons
             self.btn_playpause = wdg[0][7]
@@ -79,7 +87,7 @@ class Player:
             self.player_button_img = win.get_object('image_cover')
             self.player_event.connect('button-press-event', self.show_player)
             default = join(self.functions.datadir, 'image', 'logo_head_big.png')
-            cover_px = Pixbuf.new_from_file_at_scale(default, 20, 20, True)
+            cover_px = self.pixbufs.load_file(default, 20, 20)
             self.player_button_img.set_from_pixbuf(cover_px)
             self.player_event.set_sensitive(False)
 
@@ -153,6 +161,7 @@ class Player:
         self.extensions.connect('OnPlayNewSong', self.on_play_new_song)
         self.extensions.connect('OnPlayNewAlbum', self.on_play_new_album)
         self.extensions.connect('OnAbortPlayback', self.on_abort_playback)
+        self.extensions.connect('OnUpcomingSongs', self.on_upcoming_songs)
 
         self.extensions.connect('OnPlayPressed', self.play_pressed)
         self.extensions.connect('OnStopPressed', self.stop_pressed)
@@ -161,14 +170,10 @@ class Player:
 
 
     def previous_pressed(self, wdg=None):
-        if self.current_album:
+        if (self.current_album and
+            self.current_song in self.current_album.tracks):
             # We are listening an album: move to previous song
-            album_items = len(self.current_album.tracks) - 1
-            a = -1
-            for sng in self.current_album.tracks:
-                a += 1
-                if sng.track == self.current_song.track:
-                   item_in_album = a
+            item_in_album = self.current_album.tracks.index(self.current_song)
 
             if item_in_album > 0:
                 self.on_play_new_song(self.current_album.tracks[item_in_album - 1])
@@ -199,7 +204,7 @@ class Player:
         self.headerbar.props.subtitle = ''
 
         default = join(self.functions.datadir, 'image', 'logo_head_big.png')
-        cover_px = Pixbuf.new_from_file_at_scale(default, 20, 20, True)
+        cover_px = self.pixbufs.load_file(default, 20, 20)
         self.player_button_img.set_from_pixbuf(cover_px)
         self.player_event.set_sensitive(False)
         self.lyrics_button.set_sensitive(False)
@@ -228,14 +233,12 @@ class Player:
                  name='media-playback-pause-symbolic'), IconSize.BUTTON))        
 
     def next_pressed(self, wdg=None):
-        if self.current_album:
-            # We are listening an album: move to next song
+        if (self.current_album and
+            self.current_song in self.current_album.tracks):
+            # We are listening an album: move to next song, by its position
+            # as for the upcoming song
             album_items = len(self.current_album.tracks) - 1
-            a = -1
-            for sng in self.current_album.tracks:
-                a += 1
-                if sng.track == self.current_song.track:
-                   item_in_album = a
+            item_in_album = self.current_album.tracks.index(self.current_song)
 
             if item_in_album < album_items:
                 self.on_play_new_song(self.current_album.tracks[item_in_album + 1])
@@ -249,18 +252,17 @@ class Player:
         self.stop_pressed(None)
 
     def on_play_new_song(self, song):
+        # Forget the album being played if the song isn't part of it
+        if self.current_album and song not in self.current_album.tracks:
+            self.current_album = False
+
         # Guess ReplayGain mode
         if hasattr(song, 'rg_mode_guess') and song.rg_mode_guess == 'album':
             self.gst.change_rg_mode('album')
+        elif self.current_album:
+            self.gst.change_rg_mode('album')
         else:
-            if not self.current_album:
-                self.gst.change_rg_mode('track')
-            else:
-                if song in self.current_album.tracks:
-                    self.gst.change_rg_mode('album')
-                else:
-                    self.current_album = False
-                    self.gst.change_rg_mode('track')
+            self.gst.change_rg_mode('track')
 
         # Play the song
         cur = self.gst.getnow()
@@ -268,6 +270,7 @@ class Player:
 
         # Update global vars
         self.current_song = song
+        self.upcoming_song = None
 
         # Update user interface
         self.btn_playpause.set_image(Image.new_from_gicon(ThemedIcon(
@@ -283,10 +286,12 @@ class Player:
         default = join(self.functions.datadir, 'image', 'logo_head_big.png')
         bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
         cover = join(bdir, self.functions.get_hash(album, artist))
+        cover_px = None
         if isfile(cover):
-            cover_px = Pixbuf.new_from_file_at_scale(cover, 32, 32, True)
-        else:
-            cover_px = Pixbuf.new_from_file_at_scale(default, 20, 20, True)
+            cover_px = self.pixbufs.load(cover, 32)
+
+        if cover_px is None:
+            cover_px = self.pixbufs.load_file(default, 20, 20)
 
         self.player_button_img.set_from_pixbuf(cover_px)
         self.player_event.set_sensitive(True)
@@ -299,22 +304,31 @@ class Player:
         file_.close()
 
         # Update player informations
+        cover_px = None
         if isfile(cover):
-            cover_px = Pixbuf.new_from_file_at_scale(cover, 200, 200, True)
-        else:
-            cover_px = Pixbuf.new_from_file_at_scale(default, 120, 120, True)
+            cover_px = self.pixbufs.load(cover, 200)
+
+        if cover_px is None:
+            cover_px = self.pixbufs.load_file(default, 120, 120)
         self.player_img.set_from_pixbuf(cover_px)
 
         # Create the scale
         self.player_sca.set_sensitive(True)
         self.player_sca.set_range(0, float(song.length))
-        timeout_add(500, self.scale_timer)
 
         # Download lyrics
         thread = Thread(group=None, target=self.lyrics_downloader.get_lyrics,
                         name='lyrics', args=(title, artist))
         thread.start()
 
+        # Prepare the next songs of the album
+        if self.current_album and song in self.current_album.tracks:
+            position = self.current_album.tracks.index(song)
+            upcoming = self.current_album.tracks[position + 1:]
+            if len(upcoming) > 0:
+                self.upcoming_song = upcoming[0]
+            self.prefetcher.prefetch(upcoming)
+
         # Send notification to extensions about this new song
         self.extensions.load_event('HasStartedSong', song)
 
@@ -322,20 +336,40 @@ class Player:
         self.current_album = album
         self.on_play_new_song(album.tracks[0])
 
-    def song_nearly_ended(self, *args):
-        idle_add(self.next_pressed, True)
+    def on_upcoming_songs(self, songs):
+        # The album being played decides of the next song
+        if not self.current_album and len(songs) > 0:
+            self.upcoming_song = songs[0]
+
+        self.prefetcher.prefetch(songs)
+
+    def get_next_song(self):
+        # Called by GStreamer before the end of the song to play the next one
+        # without gap, this isn't the main loop
+        song = self.upcoming_song
+        if song is not None:
+            return song.filename
+
+    def on_gapless_song(self, filename):
+        # The next song started, move to it as usual, GStreamer doesn't
+        # launch it again
+        self.next_pressed()
+
+    def on_song_ended(self):
+        self.next_pressed()
 
     def show_player(self, widget, ka):
         self.player_pop.show_all()
 
-    def scale_timer(self):
-        pos = self.gst.getposition()
-        position = int(self.gst.getposition() / 1000000000)
+    def on_position_changed(self, position):
+        # Called by GStreamer while playing, position is in seconds
+        seconds = int(position)
         self.player_scalab.set_markup('<span size="small">' +
-                                      self.functions.human_length(position) +
+                                      self.functions.human_length(seconds) +
                                       '</span>')
-        self.player_sca.set_value(position)
-        return True
+        self.player_sca.set_value(seconds)
+
+        self.extensions.load_event('OnPositionChanged', position)
 
     def on_change_value(self, widget, scroll, value):
         seconds = int(value)
@@ -18,14 +18,16 @@
 from gettext import gettext as _
 from urllib.parse import quote as urllib_quote
 from urllib.error import HTTPError
-from re import findall as re_findall, sub as re_sub, compile as re_compile
+from http.client import HTTPException
+from html.parser import HTMLParser
+from abc import ABCMeta, abstractmethod
 from os.path import isfile, join
 from unicodedata import normalize
-from bs4 import BeautifulSoup
 
-from common.webservices import WebServices
+from common.webservices import WebServices, HTTPClient
 from common.functions import Functions
 from common.config import ConfigLoader
+from common.negativecache import NegativeCache
 
 functions = Functions()
 
@@ -34,6 +36,7 @@ class LyricsDownloader:
 
     def __init__(self):
         self.config = ConfigLoader()
+        self.misses = NegativeCache('lyrics')
 
     def get_lyrics(self, title, artist, no_download=False):
         """Return lyrics for a song."""
@@ -47,91 +50,177 @@ class LyricsDownloader:
             file_ = open(lyrics_file)
             lyrics = file_.read()
             file_.close()
-        elif not isfile(lyrics_file) and not no_download:
+        elif (not isfile(lyrics_file) and not no_download and
+              not self.misses.is_missing(song_hash)):
             # We need to download lyrics for this song
-            lyricsmode = LyricsMode()
-            lyrics = lyricsmode.get_lyrics(title, artist)
-            if lyrics is None:
-                lyricswikia = LyricsWikia()
-                lyrics = lyricswikia.get_lyrics(title, artist)
+            unreachable = False
+            for provider in PROVIDERS:
+                try:
+                    lyrics = provider().get_lyrics(title, artist)
+                except (HTTPException, OSError) as error:
+                    print('[LYRICS] Unable to reach %s: %s' %
+                          (provider.__name__, error))
+                    unreachable = True
+                    continue
+
+                if lyrics is not None:
+                    break
 
             # Save the lyrics
             if lyrics is not None:
                 file_ = open(lyrics_file, 'w')
                 file_.write(lyrics)
                 file_.close()
+                self.misses.remove(song_hash)
+            elif not unreachable:
+                # Don't ask the websites again before a while, unless one
+                # of them couldn't answer
+                self.misses.add(song_hash)
 
         # Return the lyrics
         return lyrics
 
-class LyricsMode(WebServices):
-    """Wrapper for LyricsMode.com."""
+class LyricsParser(HTMLParser):
+    """Extract the text of the lyrics block of a page, fed chunk by chunk.
+
+    The block is the first `tag` element having the `attrs` attributes,
+    `done` is set once it is closed so the rest of the page doesn't have to
+    be read. Scripts are skipped and <br> are replaced by `br`."""
+
+    tag = None
+    attrs = {}
+    br = '\n'
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.depth = 0
+        self.in_script = False
+        self.done = False
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+
+        if self.depth == 0:
+            attrs = dict(attrs)
+            for (name, value) in self.attrs.items():
+                if value not in (attrs.get(name) or '').split():
+                    return
+
+            if tag == self.tag:
+                self.depth = 1
+        elif tag == self.tag:
+            self.depth += 1
+        elif tag == 'br':
+            self.parts.append(self.br)
+        elif tag == 'script':
+            self.in_script = True
+
+    def handle_startendtag(self, tag, attrs):
+        if self.depth > 0 and tag == 'br':
+            self.parts.append(self.br)
+
+    def handle_endtag(self, tag):
+        if self.depth == 0:
+            return
+
+        if tag == 'script':
+            self.in_script = False
+        elif tag == self.tag:
+            self.depth -= 1
+            if self.depth == 0:
+                self.done = True
+
+    def handle_data(self, data):
+        if self.depth > 0 and not self.in_script:
+            self.parts.append(data)
+
+    def get_lyrics(self):
+        lyrics = ''.join(self.parts).strip()
+
+        if lyrics != '':
+            return lyrics
+        else:
+            return None
+
+class LyricsProvider(WebServices, metaclass=ABCMeta):
+    """A lyrics website: `get_url()` gives the page of a song and `parser`
+    extracts the lyrics out of it."""
+
+    parser = LyricsParser
+
+    @abstractmethod
+    def get_url(self, title, artist):
+        """Return the address of the page of a song on the website."""
 
     def get_lyrics(self, title, artist):
-        lyrics = ''
+        return self.parse(HTTPClient().stream(self.get_url(title, artist)))
+
+    def parse(self, chunks):
+        """Read the lyrics from a page given as any iterable of chunks of
+        text."""
+        parser = self.parser()
+
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                if parser.done:
+                    break
+        except HTTPError as error:
+            # The website has no page for this song
+            if error.code == 404:
+                return None
+            raise
+        finally:
+            # A generator downloading the page drops its connection
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+        return parser.get_lyrics()
 
+class LyricsModeParser(LyricsParser):
+    tag = 'p'
+    attrs = {'id': 'lyrics_text'}
+    br = ''
+
+class LyricsMode(LyricsProvider):
+    """Wrapper for LyricsMode.com."""
+
+    parser = LyricsModeParser
+
+    def get_url(self, title, artist):
         artist = artist.replace(' ', '_').lower()
         artist = normalize('NFD', artist).encode('ascii', 'ignore')
 
         title = title.replace(' ', '_').lower()
         title = normalize('NFD', title).encode('ascii', 'ignore')
 
-        url = ('http://www.lyricsmode.com/lyrics/%s/%s/%s.html' % (
-               urllib_quote(artist.decode('utf-8'))[0],
-               urllib_quote(artist.decode('utf-8')),
-               urllib_quote(title.decode('utf-8'))))
+        return ('http://www.lyricsmode.com/lyrics/%s/%s/%s.html' % (
+                urllib_quote(artist.decode('utf-8'))[0],
+                urllib_quote(artist.decode('utf-8')),
+                urllib_quote(title.decode('utf-8'))))
 
-        try:
-            page = self.get_html(url)
-        except HTTPError:
-            page = ''
-
-        clean_reg = re_compile('<.*?>')
-        for txt in re_findall('(?s)<p id="lyrics_text" ' +
-                              'class="ui-annotatable">(.*?)</p>', str(page)):
-            txt = re_sub(clean_reg, '', txt)
-            txt = txt.replace('\\\'', "'")
-            txt = txt.replace('\\n', '\n')
-            
-            lyrics = txt
-
-        if lyrics != '':
-            return lyrics
-        else:
-            return None
+class LyricsWikiaParser(LyricsParser):
+    tag = 'div'
+    attrs = {'class': 'lyricbox'}
 
-class LyricsWikia(WebServices):
+class LyricsWikia(LyricsProvider):
     """Wrapper for Lyrics.wikia.com"""
 
-    def get_lyrics(self, title, artist):
-        lyrics = ''
+    parser = LyricsWikiaParser
 
+    def get_url(self, title, artist):
         artist = artist.replace(' ', '_')
         artist = normalize('NFD', artist).encode('ascii', 'ignore')
 
         title = title.replace(' ', '_')
         title = normalize('NFD', title).encode('ascii', 'ignore')
 
-        url = ('http://lyrics.wikia.com/wiki/%s:%s' % (
-               urllib_quote(artist.decode('utf-8')),
-               urllib_quote(title.decode('utf-8'))))
-
-        try:
-            page = self.get_html(url)
-        except HTTPError:
-            page = ''
-
-        soup = BeautifulSoup(page, 'html.parser')
-        rew = soup.find('div', {'class': 'lyricbox'})
+        return ('http://lyrics.wikia.com/wiki/%s:%s' % (
+                urllib_quote(artist.decode('utf-8')),
+                urllib_quote(title.decode('utf-8'))))
 
-        if rew is None:
-            return None
-        else:
-            for txt in re_findall('(?s)</script>(.*?)<!--', str(rew)):
-                txt = txt.replace('<br/>', '\n')
-                lyrics = txt
-
-            if lyrics != '':
-                return lyrics
-            else:
-                return None
+# Lyrics websites, in the order they are asked
+PROVIDERS = [LyricsMode, LyricsWikia]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from os.path import join, isfile
+from urllib.error import URLError
+from http.client import HTTPException
+from threading import Thread, Lock
+from queue import Queue
+
+from common.functions import Functions
+from common.config import ConfigLoader
+from common.pixbufcache import PixbufCache
+from common.fetcher import FetchScheduler
+from modules.player.lyrics import LyricsDownloader
+
+# Sizes of the cover shown by the player
+COVER_SIZES = (32, 200)
+
+class Prefetcher:
+    """Prepare the songs that will be played next.
+
+    Their lyrics are downloaded and their cover is thumbnailed and decoded,
+    so changing song doesn't wait for them. Missing covers are asked to the
+    FetchScheduler."""
+
+    def __init__(self):
+        self.functions = Functions()
+        self.userconf = ConfigLoader()
+        self.pixbufs = PixbufCache()
+        self.lyrics_downloader = LyricsDownloader()
+
+        self.depth = int(self.userconf.config['Player']['prefetch_depth'])
+        workers = int(self.userconf.config['Player']['prefetch_workers'])
+
+        self.lock = Lock()
+        self.pending = set()
+        self.queue = Queue()
+
+        for i in range(max(1, workers)):
+            thread = Thread(group=None, target=self.worker,
+                            name='prefetcher', args=())
+            thread.daemon = True
+            thread.start()
+
+    def prefetch(self, songs):
+        """Prepare the first songs of a list of upcoming Song() objects."""
+        for song in songs[:self.depth]:
+            self.lock.acquire()
+            try:
+                if song.filename in self.pending:
+                    continue
+                self.pending.add(song.filename)
+            finally:
+                self.lock.release()
+
+            self.queue.put(song)
+
+    def worker(self):
+        while True:
+            song = self.queue.get()
+
+            try:
+                self.prepare(song)
+            except (URLError, HTTPException, OSError):
+                print('[PREFETCH] Unable to prepare ' + song.filename)
+            except Exception as error:
+                print('[PREFETCH] Unable to prepare %s: %s' %
+                      (song.filename, error))
+            finally:
+                self.lock.acquire()
+                self.pending.discard(song.filename)
+                self.lock.release()
+
+    def prepare(self, song):
+        self.lyrics_downloader.get_lyrics(song.title, song.artist)
+
+        bdir = join(self.userconf.datadir, 'modules', 'player', 'covers')
+        cover = join(bdir, self.functions.get_hash(song.album, song.artist))
+        if not isfile(cover):
+            # Downloaded by the fetcher, at its pace and only once, the
+            # player finds it if it arrives in time
+            FetchScheduler().fetch_albums([(song.artist, song.album)])
+        else:
+            for size in COVER_SIZES:
+                self.pixbufs.load(cover, size)
@@ -27,12 +27,12 @@ from gi.repository.Pango import EllipsizeMode
 from gettext import gettext as _
 from random import randrange
 
-from common.sqlite import SQLite
 from common.functions import Functions
 from common.config import ConfigLoader
 from common.webservices import LastFm
 from modules.explorer.musicdb import MusicDatabase
 from modules.playlist.playlists import Playlists
+from modules.playlist.charts import Charts
 
 from models.song import Song
 from models.album import Album
@@ -52,11 +52,15 @@ class Playlist:
         self.config['shuffle'] = bool(int(shf))
         shm = self.userconf.config['Playlist']['shuffle_mode']
         self.config['shuffle_mode'] = shm
+        pfd = self.userconf.config['Player']['prefetch_depth']
+        self.config['prefetch_depth'] = int(pfd)
 
         self.lastfm = LastFm()
         self.playlists_mgmnt = Playlists()
+        self.charts = Charts()
 
         self.playlist_content = {}
+        self.playlist_missing = {}
         self.playlist_identifier = 0
         self.playlist_current = None
         self.current_playlist_id = 0
@@ -219,6 +223,7 @@ class Playlist:
         # Acquire the songs tree
         def acquire_tree(st):
             self.songs_tree = st
+            self.charts.invalidate()
 
         self.extensions.connect('OnBluemindoStarted', launch_playlist)
         self.extensions.connect('OnSongsTreeCreated', acquire_tree)
@@ -289,6 +294,7 @@ class Playlist:
 
     def clean(self, data=None):
         self.playlist_content = {}
+        self.playlist_missing = {}
         self.playlist_identifier = 0
         self.playlist_current = None
         self.liststore.clear()
@@ -298,45 +304,39 @@ class Playlist:
         self.tool_save.set_sensitive(False)
 
     def populate(self, playlist_id):
-        if playlist_id in (1, 2):
+        if playlist_id == 1:
             # Automatic playlists based on listening stats
-            if playlist_id == 1:
-                tb = 'stats_songs'
-                lm = 50
-            elif playlist_id == 2:
-                tb = 'stats_albums'
-                lm = 10
-
-            result = []
-            txt = ('select * from %s order by tracks desc limit %u' % (tb, lm))
-
-            sql = SQLite()
-            cur = sql.execute(txt)
-            for sg in cur:
-                result.append(sg)
-            sql.close()
-
-            for item in result:
-                if playlist_id == 1:
-                    sng = Song(filename=item[0])
-                    if hasattr(sng, 'title'):
-                        self.on_new_song_queued(sng)
-                elif playlist_id == 2:
-                    album_name = item[0]
-                    for it in self.songs_tree:
-                        if album_name in self.songs_tree[it]:
-                            self.on_new_album_queued(Album(it, album_name,
-                                                           self.songs_tree))
-                            break
+            for sng in self.charts.get_songs():
+                self.on_new_song_queued(sng)
+        elif playlist_id == 2:
+            for alb in self.charts.get_albums():
+                self.on_new_album_queued(alb)
         elif playlist_id > 3:
             # User-created playlists
             user_plist = self.user_playlists[playlist_id]
             plist = self.playlists_mgmnt.load_playlist(user_plist)
-
-            for item in plist:
-                sng = Song(filename=item)
-                if hasattr(sng, 'title'):
-                    self.on_new_song_queued(sng)
+            plist = [item for item in plist
+                     if item != '' and not item.startswith('#')]
+
+            mdb = MusicDatabase(None)
+            songs, missing = mdb.load_from_filenames(plist)
+
+            for sng in songs:
+                self.on_new_song_queued(Song(title=sng[0], artist=sng[1],
+                                             album=sng[2], comment=sng[3],
+                                             genre=sng[4], year=sng[5],
+                                             track=sng[6], length=sng[7],
+                                             filename=sng[8],
+                                             statistics=sng[9]))
+
+            # Keep the files that are not in the library, they are written
+            # back when this playlist is saved
+            self.playlist_missing = {user_plist: missing}
+            if len(missing) > 0:
+                print('[PLAYLIST] %d songs of %s are not in the library:' %
+                      (len(missing), user_plist))
+                for filename in missing:
+                    print('[PLAYLIST]  %s' % filename)
 
     def delete_playlist(self, widget):
         if self.current_playlist_id > 3:
@@ -404,7 +404,9 @@ class Playlist:
             item_id = item[4]
             plist_content.append(self.playlist_content[item_id])
 
-        self.playlists_mgmnt.write_playlist(user_plist, plist_content)
+        self.playlists_mgmnt.write_playlist(user_plist, plist_content,
+                                            self.playlist_missing.get(
+                                                user_plist))
 
     def on_new_song_queued(self, song_info):
         title = song_info.title
@@ -496,9 +498,9 @@ class Playlist:
                 if self.playlist_content[item_identifier].kind == 'song':
                     self.playlist_current = [item_iter, item_identifier, None]
                     self.extensions.load_event('OnPlayNewSong', current_item)
-                # The element is an album.
+                # The element is an album, its first song may already be
+                # playing without gap so the playback isn't stopped
                 else:
-                    self.extensions.load_event('OnAbortPlayback')
                     sng = self.playlist_content[item_identifier].tracks[0]
                     sng.rg_mode_guess = 'album'
                     self.playlist_current = [item_iter, item_identifier, 0]
@@ -604,6 +606,7 @@ class Playlist:
         song.increment_statistics()
         alb = Album(song.artist, song.album, self.songs_tree)
         alb.increment_statistics()
+        self.charts.record(song, alb)
 
         # Then, highlight currently playing song/album if it's in playlist
         if self.playlist_current is not None:
@@ -620,3 +623,32 @@ class Playlist:
             current_label = self.liststore[item_iter][1]
             if current_label[:2] != '◎ ':
                 self.liststore[item_iter][1] = '◎ ' + current_label
+
+            # Finally, tell which songs are coming next, at least the next
+            # one for gapless playback
+            upcoming = self.get_upcoming_songs(max(1,
+                                               self.config['prefetch_depth']))
+            if len(upcoming) > 0:
+                self.extensions.load_event('OnUpcomingSongs', upcoming)
+
+    def get_upcoming_songs(self, count):
+        """Return the next `count` songs of the playlist."""
+        songs = []
+
+        item_iter, item_identifier, item_in_album = self.playlist_current
+        item = self.playlist_content.get(item_identifier)
+        if item is not None and item.kind == 'album':
+            songs.extend(item.tracks[item_in_album + 1:])
+
+        path_int = int(self.liststore.get_path(item_iter).to_string())
+        for position in range(path_int + 1, len(self.liststore)):
+            if len(songs) >= count:
+                break
+
+            item = self.playlist_content[self.liststore[position][4]]
+            if item.kind == 'song':
+                songs.append(item)
+            else:
+                songs.extend(item.tracks)
+
+        return songs[:count]
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Lock
+
+from common.sqlite import SQLite, SONG_COLUMNS
+from models.song import Song
+from models.album import Album
+from models.statistics import Statistics
+from modules.explorer.library import leading_number
+
+# Length of the automatic playlists
+TOP_SONGS = 50
+TOP_ALBUMS = 10
+
+COLUMNS = ', '.join('songs.' + column for column in SONG_COLUMNS.split(', '))
+
+def song_row(row):
+    """Return a row of the `songs` table with its track as a number, as in
+    the library."""
+    return tuple(row[:6]) + (leading_number(row[6]),) + tuple(row[7:9])
+
+class Charts(object):
+    """Most played songs and albums.
+
+    Each chart is read with one joined query, then kept in memory and
+    updated as the plays are recorded. It is only read again when a song
+    or an album enters it."""
+
+    ref = None
+    ref2 = None
+
+    def __new__(cls, *args, **kws):
+        # Singleton
+        if cls.ref is None:
+            cls.ref = object.__new__(cls)
+        return cls.ref
+
+    def __init__(self):
+        if Charts.ref2 is None:
+            Charts.ref2 = 42
+
+            # [key, play count, songs] sorted by play count
+            self.songs = None
+            self.albums = None
+            self.lock = Lock()
+
+    def load_songs(self):
+        cur = SQLite().execute('select ' + COLUMNS + ', stats_songs.tracks '
+                               'from stats_songs join songs on '
+                               'songs.filename = stats_songs.filename '
+                               'order by stats_songs.tracks desc limit %u' %
+                               TOP_SONGS)
+
+        return [[row[8], row[9], song_row(row)] for row in cur]
+
+    def load_albums(self):
+        cur = SQLite().execute('select top.artist, top.album, top.tracks, ' +
+                               COLUMNS + ', ifnull(stats_songs.tracks, 0) '
+                               'from (select artist, album, tracks from '
+                               'stats_albums where exists (select 1 from '
+                               'songs where songs.artist = stats_albums.artist '
+                               'and songs.album = stats_albums.album) '
+                               'order by tracks desc limit %u) as top '
+                               'join songs on songs.artist = top.artist and '
+                               'songs.album = top.album left join stats_songs '
+                               'on stats_songs.filename = songs.filename '
+                               'order by top.tracks desc, top.artist, '
+                               'top.album, songs.track' % TOP_ALBUMS)
+
+        albums = []
+        for row in cur:
+            key = (row[0], row[1])
+            if len(albums) == 0 or albums[-1][0] != key:
+                albums.append([key, row[2], []])
+            albums[-1][2].append(song_row(row[3:12]) + (row[12],))
+
+        return albums
+
+    def get_songs(self):
+        """Return the most played songs."""
+        self.lock.acquire()
+        try:
+            if self.songs is None:
+                self.songs = self.load_songs()
+            chart = list(self.songs)
+        finally:
+            self.lock.release()
+
+        songs = []
+        for (filename, tracks, row) in chart:
+            songs.append(Song(title=row[0], artist=row[1], album=row[2],
+                              comment=row[3], genre=row[4], year=row[5],
+                              track=row[6], length=row[7], filename=row[8],
+                              statistics=tracks))
+
+        return songs
+
+    def get_albums(self):
+        """Return the most played albums."""
+        self.lock.acquire()
+        try:
+            if self.albums is None:
+                self.albums = self.load_albums()
+            chart = list(self.albums)
+        finally:
+            self.lock.release()
+
+        albums = []
+        for ((artist, album), tracks, rows) in chart:
+            statistics = Statistics(counts=(
+                             dict((row[8], row[9]) for row in rows),
+                             {(artist, album): tracks}))
+
+            # The album only needs its own songs
+            songs_tree = {artist: {album: [row[:9] for row in rows]}}
+            albums.append(Album(artist, album, songs_tree, statistics))
+
+        return albums
+
+    def record(self, song, album):
+        """Update the charts with the play counts of a song and of its album,
+        as stored by their increment_statistics()."""
+        self.lock.acquire()
+        try:
+            if self.songs is not None:
+                self.songs = self.update(self.songs, song.filename,
+                                         song.statistics, TOP_SONGS)
+
+            if self.albums is not None:
+                self.albums = self.update(self.albums,
+                                          (album.artist, album.name),
+                                          album.statistics, TOP_ALBUMS)
+        finally:
+            self.lock.release()
+
+    def update(self, chart, key, tracks, limit):
+        """Return a chart with the new play count of an item, or None when
+        the item enters the chart and it has to be read again."""
+        for entry in chart:
+            if entry[0] == key:
+                entry[1] = tracks
+                chart.sort(key=lambda entry: entry[1], reverse=True)
+                return chart
+
+        if len(chart) < limit or tracks > chart[-1][1]:
+            return None
+
+        return chart
+
+    def invalidate(self):
+        """Read the charts again, the library has changed."""
+        self.lock.acquire()
+        try:
+            self.songs = None
+            self.albums = None
+        finally:
+            self.lock.release()
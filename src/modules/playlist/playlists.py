@@ -71,12 +71,17 @@ class Playlists:
 
         return clean_songs
 
-    # This function writes a playlist
-    def write_playlist(self, name, songs):
+    # This function writes a playlist, the files that are not in the library
+    # are kept at its end
+    def write_playlist(self, name, songs, missing=None):
         playlist_file = open(join(self.datadir, str(name) + '.m3u8'), 'w')
 
         for song in songs:
             if hasattr(song, 'filename'):
                 playlist_file.write(song.filename + '\n')
 
+        if missing is not None:
+            for filename in missing:
+                playlist_file.write(filename + '\n')
+
         playlist_file.close()
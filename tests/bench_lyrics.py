@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time the lyrics parsers over the saved pages of tests/data.
+
+Each page is also parsed with 200 KiB of markup after the lyrics, as on a
+real website, to show that the end of the page isn't read.
+
+Usage: python tests/bench_lyrics.py"""
+
+import env
+
+from os.path import dirname, abspath, join
+from timeit import timeit
+
+from modules.player.lyrics import LyricsMode, LyricsWikia
+
+DATA = join(dirname(abspath(__file__)), 'data')
+PAGES = [(LyricsMode, 'lyricsmode.html'), (LyricsWikia, 'lyricswikia.html')]
+
+CHUNK_SIZE = 8192
+REPEAT = 200
+TAIL = '<div class="comment"><p>Comment</p></div>\n' * 5000
+
+def get_chunks(content):
+    return [content[start:start + CHUNK_SIZE]
+            for start in range(0, len(content), CHUNK_SIZE)]
+
+def count_read(provider, chunks):
+    """Return how many chunks are read to find the lyrics."""
+    read = []
+
+    def reader():
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    provider().parse(reader())
+    return len(read)
+
+def bench(provider, content):
+    chunks = get_chunks(content)
+    seconds = timeit(lambda: provider().parse(chunks), number=REPEAT)
+
+    return (seconds / REPEAT * 1000, count_read(provider, chunks), len(chunks))
+
+if __name__ == '__main__':
+    for (provider, filename) in PAGES:
+        page = open(join(DATA, filename))
+        content = page.read()
+        page.close()
+
+        print('%-18s %.3f ms, %d/%d chunks read' %
+              ((filename,) + bench(provider, content)))
+        print('%-18s %.3f ms, %d/%d chunks read' %
+              (('+ %d KiB' % (len(TAIL) // 1024),) +
+               bench(provider, content + TAIL)))
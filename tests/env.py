@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run the tests against the sources, with a temporary configuration and
+database. Import it before any module of Bluemindo."""
+
+import sys
+from os import environ
+from os.path import dirname, abspath, join
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'src'))
+
+home = mkdtemp()
+environ['XDG_CONFIG_HOME'] = join(home, 'config')
+environ['XDG_DATA_HOME'] = join(home, 'data')
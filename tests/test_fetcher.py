@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import env
+
+import unittest
+from os import listdir
+from os.path import join
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from threading import Thread, Lock
+from time import monotonic, sleep
+
+from common.config import ConfigLoader
+from common.webservices import LastFm
+from common.fetcher import TokenBucket, FetchScheduler
+
+RATE = 10
+
+class LastFmStub(BaseHTTPRequestHandler):
+    """Answer like Last.fm, with a picture for every artist and album."""
+
+    protocol_version = 'HTTP/1.1'
+    lock = Lock()
+    connections = 0
+    requests = []
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with LastFmStub.lock:
+            LastFmStub.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        image = 'http://%s:%d/image' % self.server.server_address
+
+        if url.path == '/image':
+            body = b'picture'
+        else:
+            with LastFmStub.lock:
+                LastFmStub.requests.append(monotonic())
+
+            if query['method'] == ['album.getinfo']:
+                body = ('<lfm><album><image size="mega">%s</image></album>'
+                        '</lfm>' % image).encode()
+            else:
+                body = ('<lfm><artist><image size="large">%s</image>'
+                        '</artist></lfm>' % image).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class TokenBucketTest(unittest.TestCase):
+    def test_pacing(self):
+        bucket = TokenBucket(RATE)
+        started = monotonic()
+        for i in range(5):
+            bucket.take()
+
+        # The first token is there right away
+        self.assertGreaterEqual(monotonic() - started, 4 / RATE * 0.9)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        started = monotonic()
+        for i in range(100):
+            bucket.take()
+
+        self.assertLess(monotonic() - started, 0.5)
+
+class FetchSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), LastFmStub)
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch(self):
+        userconf = ConfigLoader()
+        userconf.config['Lastfm']['workers'] = '1'
+        userconf.config['Lastfm']['rate'] = str(RATE)
+
+        api_url = 'http://%s:%d/' % self.server.server_address
+        fetcher = FetchScheduler(LastFm(api_url))
+
+        albums = [('Artist %d' % i, 'Album') for i in range(5)]
+        fetcher.fetch_albums(albums + albums[:2])
+        fetcher.fetch_artists(['Artist 0'])
+
+        started = monotonic()
+        while len(fetcher.pending) > 0 and monotonic() - started < 10:
+            sleep(0.05)
+
+        covers = join(userconf.datadir, 'modules', 'player', 'covers')
+        pictures = join(userconf.datadir, 'modules', 'explorer', 'artists')
+        self.assertEqual(len(listdir(covers)), 5)
+        self.assertEqual(len(listdir(pictures)), 1)
+
+        # Albums asked twice are only downloaded once, through one
+        # connection kept alive
+        self.assertEqual(len(LastFmStub.requests), 6)
+        self.assertEqual(LastFmStub.connections, 1)
+
+        # Requests to Last.fm are paced by the token bucket
+        for (previous, request) in zip(LastFmStub.requests,
+                                       LastFmStub.requests[1:]):
+            self.assertGreaterEqual(request - previous, 1 / RATE * 0.9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Bluemindo: Ergonomic and modern music player designed for audiophiles.
+# Copyright (C) 2007-2016  Erwan Briand
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3 of the License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import env
+
+import unittest
+from os.path import dirname, abspath, join
+
+from modules.player.lyrics import LyricsMode, LyricsWikia
+
+DATA = join(dirname(abspath(__file__)), 'data')
+
+def read_chunks(filename, size, read):
+    """Yield a saved page by chunks of `size` characters, counting them in
+    `read`."""
+    page = open(join(DATA, filename))
+    content = page.read()
+    page.close()
+
+    for start in range(0, len(content), size):
+        read.append(start)
+        yield content[start:start + size]
+
+class LyricsParserTest(unittest.TestCase):
+    def test_lyricsmode(self):
+        read = []
+        lyrics = LyricsMode().parse(read_chunks('lyricsmode.html', 7, read))
+
+        self.assertEqual(lyrics, 'First line\nSecond line & more\nThird line')
+
+    def test_lyricswikia(self):
+        read = []
+        lyrics = LyricsWikia().parse(read_chunks('lyricswikia.html', 5, read))
+
+        self.assertEqual(lyrics, 'Café au lait\nLine two\nLine three')
+
+    def test_stops_after_lyrics(self):
+        read = []
+        LyricsMode().parse(read_chunks('lyricsmode.html', 16, read))
+
+        page = open(join(DATA, 'lyricsmode.html'))
+        length = len(page.read())
+        page.close()
+
+        # The end of the page is not read
+        self.assertLess(read[-1] + 16, length)
+
+    def test_list_of_chunks(self):
+        chunks = list(read_chunks('lyricswikia.html', 32, []))
+        lyrics = LyricsWikia().parse(chunks)
+
+        self.assertEqual(lyrics, 'Café au lait\nLine two\nLine three')
+
+    def test_no_lyrics(self):
+        lyrics = LyricsWikia().parse(read_chunks('lyricsmode.html', 64, []))
+
+        self.assertIsNone(lyrics)
+
+if __name__ == '__main__':
+    unittest.main()